@@ -0,0 +1,113 @@
+import hashlib
+import io
+import os
+import uuid
+import gridfs
+from gridfs.errors import FileExists, NoFile
+from dotenv import load_dotenv
+from config.db import db
+
+load_dotenv()
+
+# "local" (content-addressed files under BLOB_STORE_DIR) or "gridfs" (MongoDB)
+BLOB_STORE = os.getenv("BLOB_STORE", "local")
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "./media/blobs")
+
+class BlobStore:
+    """
+    Stores binary blobs once per SHA-256 of their content. Documents keep only
+    the returned reference ({"sha256", "size", "content_type"}), never the bytes.
+    """
+
+    def put(self, data: bytes, content_type: str) -> dict:
+        raise NotImplementedError
+
+    def exists(self, sha256: str) -> bool:
+        raise NotImplementedError
+
+    def open(self, sha256: str):
+        """Returns (path or file object, content type), or None if the blob is missing."""
+        raise NotImplementedError
+
+    def read(self, sha256: str) -> bytes:
+        blob = self.open(sha256)
+        if blob is None:
+            return None
+        source, _ = blob
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                return f.read()
+        return source.read()
+
+    @staticmethod
+    def reference(data: bytes, content_type: str) -> dict:
+        return {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data), "content_type": content_type}
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root=BLOB_STORE_DIR):
+        self.root = root
+
+    def _path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def put(self, data, content_type):
+        ref = self.reference(data, content_type)
+        path = self._path(ref["sha256"])
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written under a temporary name and renamed, so readers never see a partial blob;
+            # the name is unique per call, since threads of one process may store the same bytes at once
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            with open(f"{tmp_path}.type", "w") as f:
+                f.write(content_type)
+            os.replace(f"{tmp_path}.type", f"{path}.type")
+            os.replace(tmp_path, path)
+        return ref
+
+    def exists(self, sha256):
+        return os.path.exists(self._path(sha256))
+
+    def open(self, sha256):
+        path = self._path(sha256)
+        if not os.path.exists(path):
+            return None
+        with open(f"{path}.type") as f:
+            content_type = f.read().strip()
+        # A path lets send_file serve ranges straight from disk
+        return os.path.abspath(path), content_type
+
+class GridFSBlobStore(BlobStore):
+    def __init__(self, database=None, bucket="blobs"):
+        self.fs = gridfs.GridFS(database if database is not None else db, collection=bucket)
+
+    def put(self, data, content_type):
+        ref = self.reference(data, content_type)
+        if not self.fs.exists(ref["sha256"]):
+            try:
+                # The hash is the file id, so a concurrent upload of the same bytes is a no-op
+                self.fs.put(data, _id=ref["sha256"], content_type=content_type)
+            except FileExists:
+                pass
+        return ref
+
+    def exists(self, sha256):
+        return self.fs.exists(sha256)
+
+    def open(self, sha256):
+        try:
+            grid_out = self.fs.get(sha256)
+        except NoFile:
+            return None
+        # Images are small; an in-memory copy gives send_file the size it needs for ranges
+        return io.BytesIO(grid_out.read()), grid_out.content_type
+
+def get_blob_store(kind=BLOB_STORE):
+    if kind == "local":
+        return LocalBlobStore()
+    if kind == "gridfs":
+        return GridFSBlobStore()
+    raise ValueError(f"Unknown BLOB_STORE: {kind}")
+
+blob_store = get_blob_store()
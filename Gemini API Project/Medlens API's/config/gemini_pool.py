@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def chunk_text(chunk):
+    """
+    Text of one streamed response chunk. chunk.text raises for chunks without
+    parts, such as a last chunk carrying only the finish reason or usage.
+    """
+    return "".join(part.text for candidate in chunk.candidates for part in candidate.content.parts)
+
+class ConcurrencySlots:
+    """
+    A counting semaphore shared by threads and coroutines on any event loop,
+    so one limit covers every caller in the process. Waiters are served in
+    arrival order; a released slot is handed straight to the next waiter, and
+    async waiters are woken on their own loop without blocking it meanwhile.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._in_use = 0
+        # threading.Event for blocked threads, (loop, future) for waiting coroutines
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _try_take(self):
+        if self._in_use < self.limit and not self._waiters:
+            self._in_use += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._lock:
+            if self._try_take():
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_take():
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # The slot was handed over just as the caller was cancelled: pass it on
+            self.release()
+            raise
+
+    @staticmethod
+    def _wake(future):
+        if not future.done():
+            future.set_result(None)
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, future = waiter
+                try:
+                    loop.call_soon_threadsafe(self._wake, future)
+                    return
+                except RuntimeError:
+                    # Its loop was closed; nobody is waiting there any more
+                    continue
+            self._in_use -= 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+class GeminiClientPool:
+    """
+    Process-wide access to Gemini: the SDK is configured once, GenerativeModel
+    instances are reused per (model name, generation config), and one set of
+    slots caps how many calls are in flight at once, across threads and event
+    loops alike, so bursts don't exhaust the quota.
+    """
+
+    def __init__(self, max_concurrency=8):
+        self.max_concurrency = max_concurrency
+        self._configured = False
+        self._models = {}
+        self._lock = threading.Lock()
+        self._slots = ConcurrencySlots(max_concurrency)
+
+    def _configure(self):
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("API_KEY is not set. Please set it in the .env file")
+        endpoint = os.getenv("GEMINI_API_ENDPOINT")
+        if endpoint:
+            # e.g. the fake Gemini server in test_gemini_pool.py; REST is the simplest transport
+            # to fake, but the SDK's async client doesn't support it, so only sync calls work there
+            genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": endpoint})
+        else:
+            genai.configure(api_key=api_key)
+        self._configured = True
+
+    def get_model(self, model_name, generation_config=None):
+        key = (model_name, json.dumps(generation_config or {}, sort_keys=True))
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                if not self._configured:
+                    self._configure()
+                model = self._models.get(key)
+                if model is None:
+                    model = genai.GenerativeModel(model_name, generation_config=generation_config)
+                    self._models[key] = model
+        return model
+
+    def generate_content(self, model_name, contents, generation_config=None, **kwargs):
+        model = self.get_model(model_name, generation_config)
+        with self._slots:
+            return model.generate_content(contents, **kwargs)
+
+    def stream_content(self, model_name, contents, generation_config=None, **kwargs):
+        """Yields response chunks; the concurrency slot is held until the stream is consumed."""
+        model = self.get_model(model_name, generation_config)
+        with self._slots:
+            for chunk in model.generate_content(contents, stream=True, **kwargs):
+                yield chunk
+
+    async def generate_content_async(self, model_name, contents, generation_config=None, **kwargs):
+        model = self.get_model(model_name, generation_config)
+        async with self._slots:
+            return await model.generate_content_async(contents, **kwargs)
+
+gemini_pool = GeminiClientPool(max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")))
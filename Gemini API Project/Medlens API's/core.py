@@ -1,7 +1,7 @@
 import os
 import PIL.Image
-import google.generativeai as genai
 from dotenv import load_dotenv
+from config.gemini_pool import gemini_pool
 
 # Load the environment variables from .env file
 load_dotenv()
@@ -13,7 +13,7 @@ class Gemini:
         if not self.api_key:
             raise ValueError("API_KEY is not set. Please set it in the .env file")
     
-        self.model = genai.GenerativeModel('gemini-1.5-pro')
+        self.model = gemini_pool.get_model('gemini-1.5-pro')
 
     def app_prompt(self) -> str:
         System_prompt = f"""Your name is Medlens. Your job is to analyze the provided image and give information about the medicine or drug it depicts, if applicable.
@@ -52,7 +52,6 @@ class Gemini:
     
     def respond_image(self, image_path: str) -> str:
         img = PIL.Image.open(image_path)
-        self.model = genai.GenerativeModel('gemini-1.5-pro') 
-        self.response = self.model.generate_content([self.app_prompt(), img])
+        self.response = gemini_pool.generate_content('gemini-1.5-pro', [self.app_prompt(), img])
         return self.response
 
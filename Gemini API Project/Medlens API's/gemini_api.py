@@ -1,17 +1,19 @@
 import os
 import json
-import PIL.Image
+import hashlib
 from bson import ObjectId
-from flask import Flask, request, jsonify, Blueprint
-import google.generativeai as genai
+from flask import Flask, Response, request, jsonify, Blueprint, stream_with_context
 from dotenv import load_dotenv
 from pymongo import MongoClient
+from config.gemini_pool import chunk_text, gemini_pool
+from image_preprocessing import preprocess_image, process_upload
+from image_cache import image_cache
+from json_stream import IncrementalJSONParser
 
 # Load the environment variables from .env file
 load_dotenv()
 
 app = Flask(__name__)
-os.makedirs("./temp", exist_ok=True)  
 
 # MongoDB setup
 client = MongoClient(os.getenv("MONGO_URI"), serverSelectionTimeoutMS=50000)
@@ -25,14 +27,23 @@ responses_collection = db['responses']
 
 # Gemini API class for handling AI interactions
 class Gemini:
+    model_name = 'gemini-1.5-pro'
+    generation_config = {"response_mime_type": "application/json"}
+
     def __init__(self) -> None:
-        # Configure the API key for Google Generative AI
-        self.api_key = os.getenv("GOOGLE_API_KEY")
-        genai.configure(api_key=self.api_key)
-        if not self.api_key:
-            raise ValueError("API_KEY is not set. Please set it in the .env file")
-    
-        self.model = genai.GenerativeModel('gemini-1.5-pro', generation_config={"response_mime_type": "application/json"})
+        # The SDK is configured once and the model reused through the process-wide pool
+        self.model = gemini_pool.get_model(self.model_name, self.generation_config)
+
+    @property
+    def prompt_version(self) -> str:
+        # Changes whenever the prompt or model changes, so cached analyses from an older prompt are not reused
+        return hashlib.sha256(f"{self.model_name}\x00{self.app_prompt()}".encode("utf-8")).hexdigest()[:12]
+
+    def _generate(self, contents):
+        return gemini_pool.generate_content(self.model_name, contents, self.generation_config)
+
+    async def _generate_async(self, contents):
+        return await gemini_pool.generate_content_async(self.model_name, contents, self.generation_config)
 
     def app_prompt(self, user_input: str = None) -> str:
         base_prompt = """
@@ -60,84 +71,174 @@ class Gemini:
             return base_prompt
 
 
-    def respond(self, image_path: str = None, user_text: str = None) -> dict:
-        prompt = self.app_prompt(user_text)
-        print("Prompt:", prompt)
-
-        if image_path and user_text:
-            img = PIL.Image.open(image_path)
-            response = self.model.generate_content([prompt, img])
-        elif image_path:
-            img = PIL.Image.open(image_path)
-            response = self.model.generate_content([prompt, img])
-        elif user_text:
-            response = self.model.generate_content([prompt])
-        else:
+    def _contents(self, image: dict = None, user_text: str = None, image_path: str = None) -> list:
+        if image_path and image is None:
+            with open(image_path, "rb") as f:
+                image = preprocess_image(f.read())
+        if not image and not user_text:
             raise ValueError("No image or text provided for generating a response.")
 
+        contents = [self.app_prompt(user_text)]
+        if image:
+            # Already downscaled and re-encoded, so it is sent as-is instead of as a PIL image
+            contents.append({"mime_type": image["mime_type"], "data": image["data"]})
+        return contents
+
+    def respond(self, image: dict = None, user_text: str = None, image_path: str = None) -> dict:
+        contents = self._contents(image, user_text, image_path)
+        print("Prompt:", contents[0])
+
+        response = self._generate(contents)
+
         print("Response:", response.text)
         return json.loads(response.text)
 
+    def respond_stream(self, image: dict = None, user_text: str = None, image_path: str = None):
+        """Yields the JSON answer as text pieces while Gemini generates it."""
+        for chunk in gemini_pool.stream_content(self.model_name, self._contents(image, user_text, image_path), self.generation_config):
+            text = chunk_text(chunk)
+            if text:
+                yield text
+
+    async def respond_async(self, image: dict = None, user_text: str = None, image_path: str = None) -> dict:
+        response = await self._generate_async(self._contents(image, user_text, image_path))
+        return json.loads(response.text)
+
 # Blueprint for Gemini API interactions
 gemini_blueprint = Blueprint('gemini', __name__, url_prefix='/app')
 
-@gemini_blueprint.route('/analyze', methods=['POST'])
-def analyze():
-    gemini = Gemini()
-
-    # Check for required parameters in the request
+def _analysis_request():
+    # Shared by the plain and streaming analyze endpoints; returns (params, error response)
     user_id = request.form.get('user_id')
     conversation_id = request.form.get('conversation_id')
     if not user_id or not conversation_id:
-        return jsonify({'error': 'user_id and conversation_id are required parameters.'}), 400
+        return None, (jsonify({'error': 'user_id and conversation_id are required parameters.'}), 400)
 
     # Check for image in the request
     img_file = request.files.get('image')
-    img_path = None
-    if img_file:
-        img_path = f"./temp/{img_file.filename}"
-        img_file.save(img_path)
 
     # Check for text in the request
     user_text = request.form.get('message')
 
-    if not img_path and not user_text:
-        return jsonify({'error': 'No image or text provided for analysis.'}), 400
+    if not img_file and not user_text:
+        return None, (jsonify({'error': 'No image or text provided for analysis.'}), 400)
 
+    # Decode, orient, downscale and re-encode in memory; nothing goes through a temp file
     try:
-        # Analyze the image/text using Gemini API
-        response = gemini.respond(image_path=img_path, user_text=user_text)
-
-        # Save the query to the database
-        query_id = queries_collection.insert_one({
-            "user_id": user_id,
-            "conversation_id": conversation_id,
-            "query_text": user_text,
-            "image_path": img_path
-        }).inserted_id
-
-        # Save the response to the database
-        response_id = responses_collection.insert_one({
-            "query_id": query_id,
-            "response_text": response
-        }).inserted_id
-
-        # Update the conversation with the new query and response IDs
-        conversations_collection.update_one(
-            {"_id": ObjectId(conversation_id)},
-            {"$push": {"queries": query_id, "responses": response_id}}
-        )
+        image, original_ref = process_upload(img_file) if img_file else (None, None)
+    except ValueError as e:
+        return None, (jsonify({'error': str(e)}), 400)
+    return (user_id, conversation_id, user_text, image, original_ref), None
+
+def _save_analysis(user_id, conversation_id, user_text, image, original_ref, response):
+    # Save the query to the database
+    query_id = queries_collection.insert_one({
+        "user_id": user_id,
+        "conversation_id": conversation_id,
+        "query_text": user_text,
+        "image": original_ref,
+        "image_sha256": image["original_sha256"] if image else None
+    }).inserted_id
+
+    # Save the response to the database
+    response_id = responses_collection.insert_one({
+        "query_id": query_id,
+        "response_text": response
+    }).inserted_id
+
+    # Update the conversation with the new query and response IDs
+    conversations_collection.update_one(
+        {"_id": ObjectId(conversation_id)},
+        {"$push": {"queries": query_id, "responses": response_id}}
+    )
+    return query_id, response_id
+
+@gemini_blueprint.route('/analyze', methods=['POST'])
+def analyze():
+    gemini = Gemini()
+
+    try:
+        params, error = _analysis_request()
+        if error:
+            return error
+        user_id, conversation_id, user_text, image, original_ref = params
+
+        # Near-duplicate photos with the same question reuse the cached analysis
+        cached, image_hash = image_cache.lookup(image["data"], user_text, gemini.prompt_version) if image else (None, None)
+        if cached is not None:
+            response = cached
+        else:
+            # Analyze the image/text using Gemini API
+            response = gemini.respond(image=image, user_text=user_text)
+            if image:
+                image_cache.store(image_hash, user_text, gemini.prompt_version, response)
+
+        query_id, response_id = _save_analysis(user_id, conversation_id, user_text, image, original_ref, response)
 
         return jsonify({
             'status': 'success',
             'query_id': str(query_id),
             'response_id': str(response_id),
-            'response': response
+            'response': response,
+            'cached': cached is not None
         })
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _sse(data, event=None):
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+@gemini_blueprint.route('/analyze/stream', methods=['POST'])
+def analyze_stream():
+    """
+    Same as /app/analyze, but streams the analysis as server-sent events: a
+    `section` event for each top-level field of the JSON answer as soon as it is
+    complete, then `done` with the stored ids once the response is saved.
+    """
+    gemini = Gemini()
+
+    try:
+        params, error = _analysis_request()
+        if error:
+            return error
+        user_id, conversation_id, user_text, image, original_ref = params
+        cached, image_hash = image_cache.lookup(image["data"], user_text, gemini.prompt_version) if image else (None, None)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    def events():
+        try:
+            if cached is not None:
+                response = cached
+                sections = response.items() if isinstance(response, dict) else enumerate(response)
+                for key, value in sections:
+                    yield _sse({'key': key, 'value': value}, event='section')
+            else:
+                parser = IncrementalJSONParser()
+                for text in gemini.respond_stream(image=image, user_text=user_text):
+                    for key, value in parser.feed(text):
+                        yield _sse({'key': key, 'value': value}, event='section')
+                response = parser.result()
+                if image:
+                    image_cache.store(image_hash, user_text, gemini.prompt_version, response)
+
+            # Persisted only once the whole answer has arrived and parsed
+            query_id, response_id = _save_analysis(user_id, conversation_id, user_text, image, original_ref, response)
+        except Exception as e:
+            yield _sse({'error': str(e)}, event='error')
+            return
+        yield _sse({
+            'status': 'success',
+            'query_id': str(query_id),
+            'response_id': str(response_id),
+            'cached': cached is not None
+        }, event='done')
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # Register the blueprint with the main Flask app
 # app.register_blueprint(gemini_blueprint)
 
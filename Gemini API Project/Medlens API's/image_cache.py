@@ -0,0 +1,112 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import time
+from PIL import Image
+
+CACHE_DB = os.getenv("IMAGE_CACHE_DB", "./media/cache/image_analysis.sqlite")
+MAX_DISTANCE = int(os.getenv("IMAGE_CACHE_MAX_DISTANCE", "3"))
+CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "50000"))
+
+# The 64-bit hash is split into 4 bands of 16 bits. Two hashes within Hamming
+# distance 3 must agree exactly on at least one band, so a lookup only compares
+# against rows that share a band instead of scanning the table.
+BANDS = 4
+
+def dhash(image_bytes, size=8):
+    """64-bit difference hash: compares neighbouring pixels of a 9x8 grayscale thumbnail."""
+    img = Image.open(io.BytesIO(image_bytes)).convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = list(img.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def _bands(value):
+    return [(value >> (16 * i)) & 0xFFFF for i in range(BANDS)]
+
+def _text_key(user_text, prompt_version):
+    normalized = " ".join((user_text or "").lower().split())
+    return hashlib.sha256(f"{prompt_version}\x00{normalized}".encode("utf-8")).hexdigest()
+
+class ImageAnalysisCache:
+    """
+    Caches structured analyses by perceptual hash of the preprocessed image plus
+    the normalized user text and prompt version, so a near-duplicate photo of
+    the same medicine reuses the earlier answer. Entries expire after `ttl` and
+    the least recently used are dropped past `max_entries`.
+    """
+
+    def __init__(self, db_path=CACHE_DB, max_distance=MAX_DISTANCE, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        if max_distance >= BANDS:
+            raise ValueError(f"max_distance must be below {BANDS} for band lookups to be exact.")
+        self.db_path = db_path
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS analyses (
+                    id INTEGER PRIMARY KEY,
+                    text_key TEXT,
+                    hash TEXT,
+                    band0 INTEGER, band1 INTEGER, band2 INTEGER, band3 INTEGER,
+                    response TEXT,
+                    created_at REAL,
+                    last_used REAL
+                )
+            """)
+            for band in range(BANDS):
+                db.execute(f"CREATE INDEX IF NOT EXISTS analyses_band{band} ON analyses (text_key, band{band})")
+            db.execute("CREATE INDEX IF NOT EXISTS analyses_last_used ON analyses (last_used)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def lookup(self, image_bytes, user_text, prompt_version):
+        """Returns (cached response or None, image hash) so a miss can be stored without rehashing."""
+        value = dhash(image_bytes)
+        text_key = _text_key(user_text, prompt_version)
+        bands = _bands(value)
+        now = time.time()
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, hash, response FROM analyses WHERE created_at > ? AND ("
+                + " OR ".join(f"(text_key = ? AND band{band} = ?)" for band in range(BANDS)) + ")",
+                (now - self.ttl, *[item for band in bands for item in (text_key, band)]),
+            ).fetchall()
+            best = None
+            for row_id, hash_hex, response in rows:
+                distance = bin(int(hash_hex, 16) ^ value).count("1")
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, row_id, response)
+            if best is None:
+                return None, value
+            db.execute("UPDATE analyses SET last_used = ? WHERE id = ?", (now, best[1]))
+        return json.loads(best[2]), value
+
+    def store(self, image_hash, user_text, prompt_version, response):
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO analyses (text_key, hash, band0, band1, band2, band3, response, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (_text_key(user_text, prompt_version), f"{image_hash:016x}", *_bands(image_hash), json.dumps(response), now, now),
+            )
+            db.execute("DELETE FROM analyses WHERE created_at <= ?", (now - self.ttl,))
+            (count,) = db.execute("SELECT COUNT(*) FROM analyses").fetchone()
+            if count > self.max_entries:
+                db.execute(
+                    "DELETE FROM analyses WHERE id IN (SELECT id FROM analyses ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+image_cache = ImageAnalysisCache()
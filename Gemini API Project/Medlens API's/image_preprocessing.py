@@ -0,0 +1,60 @@
+import hashlib
+import io
+import os
+from PIL import Image, ImageOps
+from config.blob_store import blob_store
+
+MAX_IMAGE_SIDE = int(os.getenv("MAX_IMAGE_SIDE", "1536"))
+# "JPEG" or "WEBP"
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+# Set STORE_ORIGINAL_IMAGES=1 to keep the uploaded originals in the blob store, once per content hash
+STORE_ORIGINAL_IMAGES = os.getenv("STORE_ORIGINAL_IMAGES") == "1"
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+def preprocess_image(raw, max_side=MAX_IMAGE_SIDE, fmt=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    """
+    Decodes an uploaded image in memory, applies its EXIF orientation, downscales
+    it to `max_side` and re-encodes it without metadata. Returns a dict with the
+    encoded bytes, their mime type and the final size, ready to send to Gemini.
+    Raises ValueError when `raw` is not an image Pillow can decode.
+    """
+    try:
+        img = Image.open(io.BytesIO(raw))
+        original_mime_type = Image.MIME.get(img.format, "application/octet-stream")
+        # For JPEGs this lets the decoder skip straight to a reduced size
+        img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+    except (OSError, Image.DecompressionBombError) as e:
+        # Unidentified, truncated or oversized uploads; everything here works in memory, so it's the file's fault
+        raise ValueError("Uploaded file is not a supported image") from e
+
+    # Saving without exif/icc arguments drops all metadata
+    buffer = io.BytesIO()
+    options = {"quality": quality, "optimize": True} if fmt == "JPEG" else {"quality": quality, "method": 4}
+    img.save(buffer, fmt, **options)
+    return {
+        "data": buffer.getvalue(),
+        "mime_type": MIME_TYPES[fmt],
+        "width": img.width,
+        "height": img.height,
+        "original_sha256": hashlib.sha256(raw).hexdigest(),
+        "original_mime_type": original_mime_type,
+    }
+
+def process_upload(file_storage):
+    """Reads a werkzeug upload once; returns (preprocessed image, blob reference of the stored original or None)."""
+    raw = file_storage.read()
+    image = preprocess_image(raw)
+    original_ref = blob_store.put(raw, image["original_mime_type"]) if STORE_ORIGINAL_IMAGES else None
+    return image, original_ref
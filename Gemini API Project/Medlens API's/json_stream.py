@@ -0,0 +1,65 @@
+import json
+
+class IncrementalJSONParser:
+    """
+    Parses a JSON object (or array) as its text arrives in pieces and yields each
+    top-level member as soon as it is complete, so a streamed answer can be shown
+    section by section instead of after the closing brace.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._container = None
+        self._member_start = None
+        self._count = 0
+        self.done = False
+
+    def _member(self, end):
+        member = self.text[self._member_start:end].strip()
+        self._member_start = end + 1
+        if not member:
+            return None
+        if self._container == "{":
+            return next(iter(json.loads("{" + member + "}").items()))
+        self._count += 1
+        return self._count - 1, json.loads("[" + member + "]")[0]
+
+    def feed(self, piece):
+        """Adds the next piece of text; yields (key, value) pairs, with list indexes as keys for arrays."""
+        self.text += piece
+        while self._pos < len(self.text) and not self.done:
+            char = self.text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._container = char
+                    self._member_start = self._pos + 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    member = self._member(self._pos)
+                    if member is not None:
+                        yield member
+                    self.done = True
+            elif char == "," and self._depth == 1:
+                member = self._member(self._pos)
+                if member is not None:
+                    yield member
+            self._pos += 1
+
+    def result(self):
+        """The fully parsed document, once the stream has ended."""
+        return json.loads(self.text)
@@ -1,8 +1,12 @@
 from config.db import db
+from config.blob_store import blob_store
 from datetime import datetime
 from bson import ObjectId
-from flask import request, jsonify, Blueprint
+from flask import request, jsonify, Blueprint, send_file, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
 import base64
+import io
+import re
 
 # Blueprint definition for queries
 queries = Blueprint('queries', __name__, url_prefix="/api")
@@ -10,6 +14,41 @@ queries_collection = db['queries']
 conversations_collection = db['conversation']
 responses_collection = db['responses']
 
+# Thumbnails are only rendered at these widths, so ?thumb= can't be used to make arbitrary work
+THUMBNAIL_SIZES = (128, 256, 512)
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def _store_image(data):
+    """Stores the image bytes once in the blob store and returns the reference kept on the query."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            content_type = Image.MIME.get(img.format)
+    except UnidentifiedImageError:
+        content_type = None
+    if not content_type:
+        raise ValueError("Uploaded file is not a supported image")
+    return blob_store.put(data, content_type)
+
+def _image_url(image_ref):
+    return url_for('queries.get_image', sha256=image_ref["sha256"]) if image_ref else None
+
+def _migrate_inline_images(query_ids):
+    # Queries saved before the blob store still carry base64 images; move them out on first read
+    legacy = {"_id": {"$in": query_ids}, "query_image": {"$exists": True}, "query_image_error": {"$exists": False}}
+    for query in queries_collection.find(legacy, {"query_image": 1}):
+        try:
+            image_ref = _store_image(base64.b64decode(query["query_image"]))
+        except ValueError as e:
+            # Undecodable or not an image: keep the original field, flag it so it isn't retried
+            # on every read, and let the conversation load without that image
+            print(f"Could not migrate image of query {query['_id']}: {e}")
+            queries_collection.update_one({"_id": query["_id"]}, {"$set": {"query_image_error": str(e)}})
+            continue
+        queries_collection.update_one(
+            {"_id": query["_id"]},
+            {"$set": {"image": image_ref}, "$unset": {"query_image": ""}}
+        )
+
 # Route to add a new query (text and/or image) to a conversation
 @queries.route('/conversations/<conversation_id>/add_query', methods=["POST"])
 def add_query(conversation_id):
@@ -37,15 +76,17 @@ def add_query(conversation_id):
         if query_text:
             query["query_text"] = query_text
 
-        # If an image is provided, store it as a base64 encoded string (for demonstration purposes)
-        if image:
-            image_data = base64.b64encode(image.read()).decode('utf-8')  # Store as base64 string
-            query["query_image"] = image_data  # Alternatively, save the file and use the path
-
         # If neither query_text nor image is provided, return an error
         if not query_text and not image:
             return jsonify({"error": "Either query text or image is required"}), 400
 
+        # If an image is provided, store the bytes once in the blob store and keep only the reference
+        if image:
+            try:
+                query["image"] = _store_image(image.read())
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
         # Insert the new query into the collection
         query_id = queries_collection.insert_one(query).inserted_id
 
@@ -139,16 +180,21 @@ def retrieve(conversation_id):
         # Retrieve the list of query IDs
         query_ids = conversation.get('queries', [])
 
-        # Fetch all queries and their associated responses from the collections
+        _migrate_inline_images(query_ids)
+
+        # Fetch all queries and their associated responses from the collections; images are
+        # only referenced here and fetched separately through their URL
         queries = list(queries_collection.find({'_id': {'$in': query_ids}}))
+        response_ids = [query["response_id"] for query in queries if query.get("response_id")]
+        responses_by_id = {response["_id"]: response for response in responses_collection.find({"_id": {"$in": response_ids}})}
 
         queries_list = []
         for query in queries:
-            response = responses_collection.find_one({"_id": query.get("response_id")})
+            response = responses_by_id.get(query.get("response_id"))
             query_data = {
                 "query_id": str(query['_id']),
                 "query_text": query.get('query_text'),
-                "query_image": query.get('query_image'),
+                "query_image": _image_url(query.get('image')),
                 "created_at": query['created_at'],
                 "response": {
                     "response_id": str(response['_id']) if response else None,
@@ -165,3 +211,38 @@ def retrieve(conversation_id):
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+# Route to fetch a stored image by its content hash, with range requests and optional thumbnails
+@queries.route('/images/<sha256>', methods=["GET"])
+def get_image(sha256):
+    try:
+        if not SHA256_PATTERN.match(sha256):
+            return jsonify({"error": "Invalid image id"}), 400
+
+        blob = blob_store.open(sha256)
+        if blob is None:
+            return jsonify({"error": "Image not found"}), 404
+        source, content_type = blob
+
+        thumb = request.args.get('thumb', type=int)
+        if thumb is not None:
+            if thumb not in THUMBNAIL_SIZES:
+                return jsonify({"error": f"thumb must be one of {list(THUMBNAIL_SIZES)}"}), 400
+            with Image.open(source) as img:
+                img = ImageOps.exif_transpose(img).convert("RGB")
+                img.thumbnail((thumb, thumb), Image.LANCZOS)
+                source = io.BytesIO()
+                img.save(source, "JPEG", quality=80)
+            source.seek(0)
+            content_type = "image/jpeg"
+
+        # Content-addressed, so the bytes behind a URL never change; private because these are
+        # users' medical photos, which only the browser may keep, never a shared cache or CDN
+        response = send_file(source, mimetype=content_type, conditional=True, etag=f"{sha256}-{thumb or 'full'}",
+                             max_age=31536000)
+        response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+        return response
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
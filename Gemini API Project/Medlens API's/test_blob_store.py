@@ -0,0 +1,67 @@
+import io
+import os
+import threading
+import pytest
+from PIL import Image
+
+pytest.importorskip("gridfs")
+pytest.importorskip("flask")
+from flask import Flask
+from config.blob_store import BlobStore, LocalBlobStore
+from queries import queries_routes
+
+def _jpeg(size=(800, 600)):
+    out = io.BytesIO()
+    Image.linear_gradient("L").resize(size).convert("RGB").save(out, "JPEG")
+    return out.getvalue()
+
+def test_identical_blobs_are_stored_once(tmp_path):
+    store = LocalBlobStore(root=str(tmp_path))
+    data = _jpeg()
+    refs = []
+    threads = [threading.Thread(target=lambda: refs.append(store.put(data, "image/jpeg"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(ref == BlobStore.reference(data, "image/jpeg") for ref in refs)
+    files = [name for _, _, names in os.walk(tmp_path) for name in names]
+    assert sorted(files) == sorted([refs[0]["sha256"], refs[0]["sha256"] + ".type"])
+    assert store.read(refs[0]["sha256"]) == data
+    assert store.open("0" * 64) is None
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(queries_routes, "blob_store", LocalBlobStore(root=str(tmp_path)))
+    app = Flask(__name__)
+    app.register_blueprint(queries_routes.queries, url_prefix="/app")
+    return app.test_client()
+
+def test_images_are_served_with_ranges_and_private_caching(client):
+    data = _jpeg()
+    ref = queries_routes._store_image(data)
+    url = f"/app/images/{ref['sha256']}"
+
+    response = client.get(url)
+    assert response.status_code == 200 and response.data == data
+    assert response.mimetype == "image/jpeg"
+    assert response.headers["Cache-Control"] == "private, max-age=31536000, immutable"
+
+    partial = client.get(url, headers={"Range": "bytes=10-19"})
+    assert partial.status_code == 206 and partial.data == data[10:20]
+    assert client.get(url, headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+def test_thumbnails_and_bad_requests(client):
+    ref = queries_routes._store_image(_jpeg())
+    url = f"/app/images/{ref['sha256']}"
+    thumb = client.get(f"{url}?thumb=128")
+    assert thumb.status_code == 200 and thumb.mimetype == "image/jpeg"
+    assert max(Image.open(io.BytesIO(thumb.data)).size) == 128
+    assert thumb.headers["ETag"] != client.get(url).headers["ETag"]
+
+    assert client.get(f"{url}?thumb=100").status_code == 400
+    assert client.get("/app/images/not-a-hash").status_code == 400
+    assert client.get(f"/app/images/{'0' * 64}").status_code == 404
+    with pytest.raises(ValueError):
+        queries_routes._store_image(b"not an image")
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from config.gemini_pool import ConcurrencySlots, GeminiClientPool, chunk_text
+
+def _response(text):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": 1, "index": 0}]}
+
+class FakeGemini(BaseHTTPRequestHandler):
+    """Just enough of the Gemini REST API; records how many calls were in flight at once."""
+
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(0.05)
+        with cls.lock:
+            cls.in_flight -= 1
+
+        if ":streamGenerateContent" in self.path:
+            # Real streams can end with a chunk that has a finish reason but no parts
+            body = [_response("fake "), _response("answer"),
+                    {"candidates": [{"finishReason": 1, "index": 0}], "usageMetadata": {"totalTokenCount": 3}}]
+        else:
+            body = _response("fake answer")
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    FakeGemini.in_flight = FakeGemini.max_in_flight = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGemini)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    monkeypatch.setenv("GEMINI_API_ENDPOINT", f"http://127.0.0.1:{server.server_address[1]}")
+    yield FakeGemini
+    server.shutdown()
+
+def test_calls_through_the_pool_stay_under_the_limit(fake_gemini):
+    pool = GeminiClientPool(max_concurrency=2)
+    texts = []
+
+    def call():
+        texts.append(pool.generate_content("gemini-1.5-flash", "hello").text)
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert texts == ["fake answer"] * 8
+    assert fake_gemini.max_in_flight == 2
+
+def test_streamed_chunks_come_through_the_pool(fake_gemini):
+    pool = GeminiClientPool(max_concurrency=2)
+    assert "".join(chunk_text(chunk) for chunk in pool.stream_content("gemini-1.5-flash", "hello")) == "fake answer"
+
+def test_one_limit_across_threads_and_event_loops():
+    slots = ConcurrencySlots(2)
+    state = {"in_use": 0, "max": 0, "done": 0}
+    lock = threading.Lock()
+
+    def hold():
+        with lock:
+            state["in_use"] += 1
+            state["max"] = max(state["max"], state["in_use"])
+        time.sleep(0.01)
+        with lock:
+            state["in_use"] -= 1
+            state["done"] += 1
+
+    def sync_caller():
+        with slots:
+            hold()
+
+    async def async_caller():
+        async with slots:
+            # Blocking on purpose: the loop must still not run more than the limit allows
+            hold()
+            await asyncio.sleep(0)
+
+    def loop_caller():
+        async def main():
+            await asyncio.gather(*(async_caller() for _ in range(4)))
+        asyncio.run(main())
+
+    threads = [threading.Thread(target=sync_caller) for _ in range(4)]
+    threads += [threading.Thread(target=loop_caller) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state["done"] == 12
+    assert state["max"] == 2
+
+def test_cancelled_async_waiter_gives_its_slot_back():
+    slots = ConcurrencySlots(1)
+    slots.acquire()
+
+    async def main():
+        waiter = asyncio.ensure_future(slots.acquire_async())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(main())
+    slots.release()
+    assert slots._in_use == 0 and not slots._waiters
@@ -0,0 +1,76 @@
+import io
+import time
+import pytest
+from PIL import Image, ImageDraw
+import image_cache
+from image_cache import ImageAnalysisCache
+
+def _photo(size=(320, 240), quality=95):
+    # A gradient background, since flat areas give dhash ties that JPEG noise can flip
+    img = Image.linear_gradient("L").resize((320, 240)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((40, 60, 200, 180), fill="navy")
+    draw.ellipse((180, 30, 300, 150), fill="orange")
+    out = io.BytesIO()
+    img.resize(size).save(out, "JPEG", quality=quality)
+    return out.getvalue()
+
+@pytest.fixture
+def cache(tmp_path):
+    return ImageAnalysisCache(db_path=str(tmp_path / "cache.sqlite"), max_distance=3)
+
+def test_near_duplicate_photos_reuse_the_analysis(cache):
+    _, value = cache.lookup(_photo(), "what is this?", "v1")
+    cache.store(value, "what is this?", "v1", {"name": "aspirin"})
+    # Re-encoded at another size and quality, with differently spaced text
+    response, _ = cache.lookup(_photo((640, 480), quality=60), "  What is   this? ", "v1")
+    assert response == {"name": "aspirin"}
+    assert cache.lookup(_photo(), "what is this?", "v2")[0] is None
+    assert cache.lookup(_photo(), "side effects?", "v1")[0] is None
+
+@pytest.mark.parametrize("flipped, hit", [
+    # One bit in each of three bands still leaves one band in common
+    ([0, 16, 32], True),
+    # Three bits inside one band
+    ([48, 50, 63], True),
+    ([0, 1], True),
+    # Four differing bits are past max_distance, whether they share a band or not
+    ([0, 1, 2, 3], False),
+    ([0, 16, 32, 48], False),
+])
+def test_lookup_matches_within_the_hamming_distance_across_bands(cache, monkeypatch, flipped, hit):
+    stored = 0x0123456789ABCDEF
+    cache.store(stored, "q", "v1", {"stored": True})
+    query = stored
+    for bit in flipped:
+        query ^= 1 << bit
+    monkeypatch.setattr(image_cache, "dhash", lambda image_bytes: query)
+    response, value = cache.lookup(b"", "q", "v1")
+    assert value == query
+    assert (response == {"stored": True}) is hit
+
+def test_closest_match_wins_and_old_entries_expire(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    cache = ImageAnalysisCache(db_path=str(tmp_path / "cache.sqlite"), ttl=60)
+    cache.store(0b111, "q", "v1", {"distance": 3})
+    cache.store(0b001, "q", "v1", {"distance": 1})
+    monkeypatch.setattr(image_cache, "dhash", lambda image_bytes: 0)
+    assert cache.lookup(b"", "q", "v1")[0] == {"distance": 1}
+    now[0] += 61
+    assert cache.lookup(b"", "q", "v1")[0] is None
+
+def test_least_recently_used_entries_are_dropped(tmp_path, monkeypatch):
+    cache = ImageAnalysisCache(db_path=str(tmp_path / "cache.sqlite"), max_entries=2)
+    monkeypatch.setattr(image_cache, "dhash", lambda image_bytes: int.from_bytes(image_bytes, "big"))
+    # Far apart in Hamming distance, so each image only matches itself
+    a, b, c = 0, (1 << 64) - 1, (1 << 32) - 1
+    cache.store(a, "q", "v1", {"image": "a"})
+    time.sleep(0.01)
+    cache.store(b, "q", "v1", {"image": "b"})
+    time.sleep(0.01)
+    assert cache.lookup(a.to_bytes(8, "big"), "q", "v1")[0] == {"image": "a"}
+    time.sleep(0.01)
+    cache.store(c, "q", "v1", {"image": "c"})
+    assert cache.lookup(b.to_bytes(8, "big"), "q", "v1")[0] is None
+    assert cache.lookup(a.to_bytes(8, "big"), "q", "v1")[0] == {"image": "a"}
@@ -0,0 +1,37 @@
+import io
+import pytest
+from PIL import Image
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("flask")
+from flask import Flask
+from gemini_api import gemini_blueprint
+from image_preprocessing import preprocess_image
+
+def _jpeg(size=(3000, 2000)):
+    out = io.BytesIO()
+    Image.linear_gradient("L").resize(size).convert("RGB").save(out, "JPEG")
+    return out.getvalue()
+
+def test_uploads_are_downscaled_and_reencoded():
+    image = preprocess_image(_jpeg(), max_side=1000, fmt="JPEG")
+    assert (image["width"], image["height"]) == (1000, 667)
+    assert image["mime_type"] == "image/jpeg" and image["original_mime_type"] == "image/jpeg"
+
+@pytest.mark.parametrize("raw", [b"%PDF-1.4 not an image", _jpeg()[:200]])
+def test_unreadable_uploads_raise_value_error(raw):
+    with pytest.raises(ValueError):
+        preprocess_image(raw)
+
+@pytest.mark.parametrize("path", ["/app/analyze", "/app/analyze/stream"])
+def test_analyze_rejects_a_non_image_upload_with_400(path, monkeypatch):
+    # Rejected before anything is sent to Gemini; the endpoint is never contacted
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    monkeypatch.setenv("GEMINI_API_ENDPOINT", "http://127.0.0.1:9")
+    app = Flask(__name__)
+    app.register_blueprint(gemini_blueprint)
+    response = app.test_client().post(path, data={
+        "user_id": "u", "conversation_id": "c", "image": (io.BytesIO(b"plain text"), "notes.txt"),
+    })
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Uploaded file is not a supported image"}
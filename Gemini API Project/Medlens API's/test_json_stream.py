@@ -0,0 +1,42 @@
+import json
+import pytest
+from json_stream import IncrementalJSONParser
+
+DOCUMENT = {
+    "name": "Ibuprofen, 200 mg {coated}",
+    "uses": ["pain", "fever, mild", "a \"quoted\" [bracket]"],
+    "dosage": {"adults": "1-2 tablets, every 4-6 hours", "max": 6},
+    "notes": "back\\slash \\\" and } inside",
+    "rx": False,
+}
+
+def _feed(text, size):
+    parser = IncrementalJSONParser()
+    members = []
+    for start in range(0, len(text), size):
+        members.extend(parser.feed(text[start:start + size]))
+    return parser, members
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_members_are_parsed_however_the_text_is_split(size):
+    text = json.dumps(DOCUMENT, indent=2)
+    parser, members = _feed(text, size)
+    assert members == list(DOCUMENT.items())
+    assert parser.done and parser.result() == DOCUMENT
+
+def test_members_are_yielded_as_soon_as_they_are_complete():
+    parser = IncrementalJSONParser()
+    assert list(parser.feed('{"name": "Aspirin, 100')) == []
+    assert list(parser.feed(' mg", "uses": ["pain", "fev')) == [("name", "Aspirin, 100 mg")]
+    assert list(parser.feed('er"]}')) == [("uses", ["pain", "fever"])]
+    assert parser.done
+
+def test_arrays_use_indexes_as_keys():
+    text = '[{"a": "x, y"}, "}", 3]'
+    _, members = _feed(text, 2)
+    assert members == [(0, {"a": "x, y"}), (1, "}"), (2, 3)]
+
+def test_text_after_the_document_is_ignored():
+    parser = IncrementalJSONParser()
+    assert list(parser.feed('{"a": 1}')) == [("a", 1)]
+    assert list(parser.feed(', "b": 2}')) == []
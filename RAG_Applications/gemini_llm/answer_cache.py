@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+class SemanticAnswerCache:
+    """
+    Caches LLM answers per collection. A cached answer is reused when the new
+    query retrieved exactly the same chunks and its embedding is within
+    `threshold` cosine similarity of the cached query. Entries expire after
+    `ttl_seconds`, the least recently used are evicted past `max_entries`, and
+    invalidate() drops a collection when it is re-ingested.
+    """
+
+    def __init__(self, threshold=0.95, ttl_seconds=3600, max_entries=10_000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # entry id -> (bucket, embedding, answer, created_at)
+        self._buckets = {}             # (collection, retrieved chunk ids) -> entry ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(collection_name, chunk_ids):
+        return collection_name, frozenset(str(chunk_id) for chunk_id in chunk_ids)
+
+    def _remove(self, entry_id):
+        bucket = self._entries.pop(entry_id)[0]
+        self._buckets[bucket].discard(entry_id)
+        if not self._buckets[bucket]:
+            del self._buckets[bucket]
+
+    def lookup(self, collection_name, query_embedding, chunk_ids):
+        bucket = self._bucket(collection_name, chunk_ids)
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        now = time.time()
+        with self._lock:
+            best_id, best_similarity = None, self.threshold
+            for entry_id in list(self._buckets.get(bucket, ())):
+                _, embedding, _, created_at = self._entries[entry_id]
+                if now - created_at > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                # Query embeddings are L2-normalized, so the dot product is the cosine similarity
+                similarity = float(embedding @ query_embedding)
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id][2]
+
+    def store(self, collection_name, query_embedding, chunk_ids, answer):
+        bucket = self._bucket(collection_name, chunk_ids)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (bucket, np.asarray(query_embedding, dtype=np.float32), answer, time.time())
+            self._buckets.setdefault(bucket, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, collection_name):
+        with self._lock:
+            for bucket in [bucket for bucket in self._buckets if bucket[0] == collection_name]:
+                for entry_id in list(self._buckets[bucket]):
+                    self._remove(entry_id)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# Shared by the query handler and the ingest path, which invalidates on re-ingest
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95")),
+    ttl_seconds=float(os.environ.get("ANSWER_CACHE_TTL", "3600")),
+    max_entries=int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "10000")),
+)
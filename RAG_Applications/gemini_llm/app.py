@@ -1,80 +1,283 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from werkzeug.utils import secure_filename
+import json
 import os
-from docs_preprocessing import check_document_type, text_chunking
-from openai_clip import embedding_the_chunks, tokenizer, model
-from qdrant import retrieve_from_qdrant, store_chunk_embedding_in_db, create_user_collection
-from gemini_llm import LLM
-import torch
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from openai_clip import embed_queries
+from vector_store import get_vector_store
+from bm25_index import hybrid_search, hybrid_search_batch
+from answer_cache import answer_cache
+from gemini_llm import LLM, stream_LLM
+from query_embedder import QueryEmbeddingService, QueryQueueFull
+from ingest_jobs import IngestJobQueue
+from ingest_pipeline import ingest_pdf
+from resources import resources
+from collection_names import InvalidCollectionName, validate_collection_name
+from reranker import RERANK_CANDIDATES, RERANK_TOP_N, reranker
 
 app = Flask(__name__)
+
+# Page pool workers (forkserver/spawn) import this module again as __mp_main__, and under
+# `python app.py` the debug reloader runs it in a watcher process that only restarts the
+# server (which it marks with WERKZEUG_RUN_MAIN); only the server itself loads models or
+# runs background ingestion
+IS_RELOADER_PARENT = __name__ == "__main__" and os.environ.get("WERKZEUG_RUN_MAIN") != "true"
+IS_SERVER_PROCESS = __name__ != "__mp_main__" and not IS_RELOADER_PARENT
+
+# By default models and clients load in the background while the server already accepts
+# requests (/mria/ready says 503 until they are in); WARM_UP_ON_START=1 loads them before serving
+if IS_SERVER_PROCESS:
+    if os.environ.get("WARM_UP_ON_START") == "1":
+        resources.warm_up()
+    else:
+        resources.warm_up_in_background()
 UPLOAD_FOLDER = "uploads"  # Directory to save uploaded files
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 
 # Ensure the upload folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Concurrent queries share forward passes through this micro-batcher
+query_embedder = QueryEmbeddingService(embed_queries)
+
+# "qdrant" (default) or "local" for the in-process NumPy backend, set via VECTOR_STORE
+vector_store = get_vector_store()
+
+# Uploads are ingested in the background so request workers stay free for queries
+ingest_queue = IngestJobQueue(ingest_pdf, workers=int(os.environ.get("INGEST_WORKERS", "2")), start=IS_SERVER_PROCESS)
+
+# Bounded fan-out of Gemini calls for /mria/query/batch
+MAX_BATCH_QUERIES = int(os.environ.get("MAX_BATCH_QUERIES", "500"))
+batch_llm_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("BATCH_LLM_CONCURRENCY", "8")),
+                                    thread_name_prefix="batch-llm")
+
+@app.route("/mria/ready", methods=["GET"])
+def readiness():
+    """Readiness probe: 200 once the required models and clients are loaded, 503 until then."""
+    ready = resources.ready()
+    return jsonify({"ready": ready, "resources": resources.status()}), 200 if ready else 503
+
 @app.route("/mria/upload", methods=["POST"])
 def upload_document():
+    """
+    Saves the file and queues it for ingestion; poll /mria/jobs/<job_id> for progress.
+    The file is indexed as document `document_id`, by default its file name: uploading
+    a file with the same name to the same collection replaces the previous version
+    (only changed chunks are re-embedded). Send distinct document_ids to keep
+    different files that share a name apart.
+    """
     try:
         # Check if the request contains a file
         if "file" not in request.files:
             return jsonify({"error": "File not included in the request"}), 400
 
         # Check for user_id and user_collection
-        user_id = request.get_json("user_id")
-        user_collection = request.get_json("user_collection")
+        user_id = request.form.get("user_id")
+        user_collection = request.form.get("user_collection")
         if not user_id or not user_collection:
             return jsonify({"error": "user_id and user_collection are required"}), 400
+        validate_collection_name(user_collection)
 
         # Retrieve the file
         file = request.files["file"]
 
-        # Save the file securely
+        # Save the file securely, under a unique name so concurrent uploads don't collide
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+        if not filename:
+            return jsonify({"error": "The file needs a name"}), 400
+        file_path = os.path.join(app.config["UPLOAD_FOLDER"], f"{uuid.uuid4().hex}_{filename}")
         file.save(file_path)
 
+        document_id = request.form.get("document_id") or filename
+        job, created = ingest_queue.submit(file_path, filename, user_id, user_collection, document_id)
+        if not created:
+            # This exact version of the document is already queued or ingested
+            os.remove(file_path)
+
         return jsonify({
-            "message": "File uploaded and processed successfully",
-            "file_path": file_path,
+            "message": "File uploaded and queued for processing" if created else "File already uploaded",
+            "job_id": job["id"],
+            "status": job["status"],
+            "document_id": job["document_id"],
             "user_id": user_id,
             "user_collection": user_collection
-        }), 200
+        }), 202 if created else 200
+    except InvalidCollectionName as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def _job_response(job):
+    return {key: job[key] for key in
+            ("id", "status", "stage", "progress", "error", "file_name", "collection", "document_id", "created_at", "updated_at")}
+
+@app.route("/mria/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = ingest_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(_job_response(job)), 200
+
+@app.route("/mria/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    job = ingest_queue.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(_job_response(job)), 200
+
+
+def _retrieve(data):
+    # Shared by the plain and streaming query endpoints
+    user_query = data.get("user_query")
+    collection_name = data.get("user_collection")
+    # "hybrid" fuses BM25 and dense results; "dense" is vector search only
+    retrieval_mode = data.get("retrieval_mode", "hybrid")
+    # Reranking scores a larger candidate pool with the cross-encoder and keeps fewer, better chunks
+    rerank = data.get("rerank", os.environ.get("RERANK", "0") == "1")
+    if not user_query or not collection_name:
+        return None
+    # Checked once here; unknown but valid names simply have no index yet
+    validate_collection_name(collection_name)
+
+    # Generate query embedding
+    query_embedding = query_embedder.embed(user_query)
+
+    # Perform similarity search
+    top_k = int(data.get("rerank_candidates", RERANK_CANDIDATES)) if rerank else 5
+    if retrieval_mode == "hybrid":
+        retrieved_chunks = hybrid_search(vector_store, collection_name, user_query, query_embedding, top_k=top_k)
+    else:
+        retrieved_chunks = vector_store.search(collection_name, query_embedding, top_k=top_k)
+    if rerank:
+        retrieved_chunks = reranker.rerank(user_query, retrieved_chunks, top_n=int(data.get("rerank_top_n", RERANK_TOP_N)))
+    return user_query, collection_name, query_embedding, retrieved_chunks
+
+
 @app.route("/mria/query", methods=["POST"])
 def query_model():
     """API for querying the model with similarity search."""
     try:
         # Get the query and user details
-        user_query = request.json("user_query")
-        collection_name = request.json("user_collection")
-        
-        if not user_query or not collection_name:
+        retrieval = _retrieve(request.get_json() or {})
+        if retrieval is None:
             return jsonify({"error": "Missing required parameters (user_query, user_collection)."}), 400
+        user_query, collection_name, query_embedding, retrieved_chunks = retrieval
 
-        # Generate query embedding
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        inputs = tokenizer(user_query, return_tensors="pt", padding=True, truncation=True).to(device)
-        with torch.no_grad():
-            text_outputs = model(**inputs)
-            sentence_embeddings = text_outputs[0][:, 0]
+        # Pass retrieved chunks and query to Gemini LLM, unless a near-identical
+        # question over the same chunks was answered already
+        return jsonify(_answer(user_query, collection_name, query_embedding, retrieved_chunks))
 
-        query_embedding = torch.nn.functional.normalize(sentence_embeddings, p=2, dim=1).squeeze(0).cpu().tolist()
+    except InvalidCollectionName as e:
+        return jsonify({"error": str(e)}), 400
+    except QueryQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def _answer(user_query, collection_name, query_embedding, retrieved_chunks):
+    chunk_ids = [chunk["id"] for chunk in retrieved_chunks]
+    cached_response = answer_cache.lookup(collection_name, query_embedding, chunk_ids)
+    if cached_response is not None:
+        return {"user_query": user_query, "response": cached_response, "cached": True}
+    response = LLM(retrieved_chunks, user_query)
+    answer_cache.store(collection_name, query_embedding, chunk_ids, response)
+    return {"user_query": user_query, "response": response, "cached": False}
+
+@app.route("/mria/query/batch", methods=["POST"])
+def query_model_batch():
+    """
+    Answers many queries against one collection: one batched embedding pass,
+    one batched vector search, then Gemini calls with bounded concurrency.
+    Results come back in request order, each with either a response or an error.
+    """
+    try:
+        data = request.get_json() or {}
+        user_queries = data.get("user_queries")
+        collection_name = data.get("user_collection")
+        retrieval_mode = data.get("retrieval_mode", "hybrid")
+        if not isinstance(user_queries, list) or not user_queries or not collection_name:
+            return jsonify({"error": "Missing required parameters (user_queries, user_collection)."}), 400
+        if len(user_queries) > MAX_BATCH_QUERIES:
+            return jsonify({"error": f"At most {MAX_BATCH_QUERIES} queries per batch."}), 400
+        validate_collection_name(collection_name)
+
+        # Invalid items get their error up front; the rest go through the batch
+        results = [None] * len(user_queries)
+        valid = []
+        for i, user_query in enumerate(user_queries):
+            if isinstance(user_query, str) and user_query.strip():
+                valid.append(i)
+            else:
+                results[i] = {"user_query": user_query, "error": "Query must be a non-empty string."}
+        texts = [user_queries[i] for i in valid]
+
+        query_embeddings = embed_queries(texts).tolist()
+        if retrieval_mode == "hybrid":
+            retrieved = hybrid_search_batch(vector_store, collection_name, texts, query_embeddings, top_k=5)
+        else:
+            retrieved = vector_store.search_batch(collection_name, query_embeddings, top_k=5)
+
+        futures = [
+            batch_llm_pool.submit(_answer, text, collection_name, query_embedding, retrieved_chunks)
+            for text, query_embedding, retrieved_chunks in zip(texts, query_embeddings, retrieved)
+        ]
+        for i, future in zip(valid, futures):
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                results[i] = {"user_query": user_queries[i], "error": str(e)}
 
-        # Perform similarity search
-        retrieved_chunks = retrieve_from_qdrant(collection_name, query_embedding, top_k=5)
+        return jsonify({"user_collection": collection_name, "results": results})
 
-        # Pass retrieved chunks and query to Gemini LLM
-        response = LLM(retrieved_chunks, user_query)
+    except InvalidCollectionName as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify({"user_query": user_query, "response": response})
 
+def _sse(data, event=None):
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+@app.route("/mria/query/stream", methods=["POST"])
+def query_model_stream():
+    """Same as /mria/query, but streams the answer as server-sent events while it is generated."""
+    try:
+        retrieval = _retrieve(request.get_json() or {})
+        if retrieval is None:
+            return jsonify({"error": "Missing required parameters (user_query, user_collection)."}), 400
+    except InvalidCollectionName as e:
+        return jsonify({"error": str(e)}), 400
+    except QueryQueueFull as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    user_query, collection_name, query_embedding, retrieved_chunks = retrieval
+
+    def events():
+        chunk_ids = [chunk["id"] for chunk in retrieved_chunks]
+        cached_response = answer_cache.lookup(collection_name, query_embedding, chunk_ids)
+        if cached_response is not None:
+            yield _sse({"text": cached_response})
+            yield _sse({"cached": True}, event="done")
+            return
+
+        pieces = []
+        try:
+            for text in stream_LLM(retrieved_chunks, user_query):
+                pieces.append(text)
+                yield _sse({"text": text})
+        except Exception as e:
+            yield _sse({"error": str(e)}, event="error")
+            return
+        answer_cache.store(collection_name, query_embedding, chunk_ids, "".join(pieces))
+        yield _sse({"cached": False}, event="done")
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,132 @@
+import json
+import math
+import os
+import re
+import sqlite3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from collection_names import validate_collection_name
+
+BM25_DIR = os.path.join(".rag", "bm25")
+
+# Keeps codes like "AB-1234" or "2.5mg" together and also indexes their parts
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = re.split(r"[-./]", token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+class BM25Index:
+    """
+    Okapi BM25 over the chunk texts of one collection, stored as an inverted
+    index in SQLite so it survives restarts and is updated with each ingest.
+    """
+
+    def __init__(self, collection_name, root=BM25_DIR, k1=1.2, b=0.75):
+        self.root = root
+        self.path = os.path.join(root, f"{validate_collection_name(collection_name)}.sqlite")
+        self.k1 = k1
+        self.b = b
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _connect_for_write(self):
+        # The file and schema are only created by writes; searches never create an index
+        os.makedirs(self.root, exist_ok=True)
+        db = self._connect()
+        with db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS docs (point_id TEXT PRIMARY KEY, length INTEGER, payload TEXT)")
+            db.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT, point_id TEXT, tf INTEGER, PRIMARY KEY (term, point_id))")
+            db.execute("CREATE INDEX IF NOT EXISTS postings_point ON postings (point_id)")
+        return db
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def add(self, ids, payloads):
+        """Indexes (or re-indexes) points; every payload needs a "text" field."""
+        with self._connect_for_write() as db:
+            for point_id, payload in zip(ids, payloads):
+                point_id = str(point_id)
+                counts = Counter(tokenize(payload["text"]))
+                db.execute("DELETE FROM postings WHERE point_id = ?", (point_id,))
+                db.execute(
+                    "INSERT OR REPLACE INTO docs (point_id, length, payload) VALUES (?, ?, ?)",
+                    (point_id, sum(counts.values()), json.dumps(payload)),
+                )
+                db.executemany(
+                    "INSERT INTO postings (term, point_id, tf) VALUES (?, ?, ?)",
+                    [(term, point_id, tf) for term, tf in counts.items()],
+                )
+
+    def delete(self, ids):
+        if not self.exists():
+            return
+        ids = [(str(point_id),) for point_id in ids]
+        with self._connect() as db:
+            db.executemany("DELETE FROM postings WHERE point_id = ?", ids)
+            db.executemany("DELETE FROM docs WHERE point_id = ?", ids)
+
+    def search(self, query, top_k=5):
+        terms = set(tokenize(query))
+        if not terms or not self.exists():
+            return []
+        with self._connect() as db:
+            n_docs, total_length = db.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+            if not n_docs:
+                return []
+            avg_length = total_length / n_docs
+            scores = Counter()
+            for term in terms:
+                postings = db.execute(
+                    "SELECT p.point_id, p.tf, d.length FROM postings p JOIN docs d ON d.point_id = p.point_id WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for point_id, tf, length in postings:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[point_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+            results = []
+            for point_id, score in scores.most_common(top_k):
+                (payload,) = db.execute("SELECT payload FROM docs WHERE point_id = ?", (point_id,)).fetchone()
+                results.append({"id": point_id, **json.loads(payload), "score": score})
+        return results
+
+def reciprocal_rank_fusion(result_lists, top_k=5, k=60):
+    """Merges ranked result lists by sum(1 / (k + rank)); ids must match across lists."""
+    fused = {}
+    for results in result_lists:
+        for rank, hit in enumerate(results):
+            key = str(hit["id"])
+            if key not in fused:
+                fused[key] = {**hit, "score": 0.0}
+            fused[key]["score"] += 1.0 / (k + rank + 1)
+    return sorted(fused.values(), key=lambda hit: hit["score"], reverse=True)[:top_k]
+
+_search_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid-search")
+
+def hybrid_search(vector_store, collection_name, query_text, query_vector, top_k=5, candidates=20):
+    """Runs dense and BM25 search concurrently and fuses them with reciprocal-rank fusion."""
+    dense = _search_pool.submit(vector_store.search, collection_name, query_vector, candidates)
+    sparse = _search_pool.submit(BM25Index(collection_name).search, query_text, candidates)
+    return reciprocal_rank_fusion([dense.result(), sparse.result()], top_k=top_k)
+
+def hybrid_search_batch(vector_store, collection_name, query_texts, query_vectors, top_k=5, candidates=20):
+    """Batched variant of hybrid_search: one dense batch search, BM25 per query, then RRF per query."""
+    dense = _search_pool.submit(vector_store.search_batch, collection_name, query_vectors, candidates)
+    index = BM25Index(collection_name)
+    sparse = [index.search(query_text, candidates) for query_text in query_texts]
+    return [
+        reciprocal_rank_fusion([dense_hits, sparse_hits], top_k=top_k)
+        for dense_hits, sparse_hits in zip(dense.result(), sparse)
+    ]
@@ -0,0 +1,13 @@
+import re
+
+# Collection names become file and directory names (BM25 index, local vector store),
+# so only plain names are accepted: no separators, no "..", no hidden files
+COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,127}$")
+
+class InvalidCollectionName(ValueError):
+    pass
+
+def validate_collection_name(collection_name):
+    if not isinstance(collection_name, str) or not COLLECTION_NAME_PATTERN.match(collection_name) or ".." in collection_name:
+        raise InvalidCollectionName(f"Invalid collection name: {collection_name!r}")
+    return collection_name
@@ -0,0 +1,87 @@
+import os
+import re
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500"))
+MAX_OVERLAP_CHARS = 400
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def approx_token_count(text):
+    # Local estimate: words and punctuation, with long words counted as several subword tokens
+    return sum(max(1, len(piece) // 4) for piece in _TOKEN_PATTERN.findall(text))
+
+def tokenizer_token_counter(tokenizer):
+    """Token counter backed by a Hugging Face tokenizer, e.g. the one in openai_clip."""
+    return lambda text: len(tokenizer(text, add_special_tokens=False, verbose=False)["input_ids"])
+
+def _text_overlap(left, right, max_chars=MAX_OVERLAP_CHARS):
+    # Length of the longest suffix of `left` that is also a prefix of `right`
+    for size in range(min(len(left), len(right), max_chars), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+def _merge_pair(left, right):
+    """Merges two chunks of one document (and page, for spans) if they overlap or touch, else returns None."""
+    if "start" in left and "start" in right:
+        if right["start"] > left["end"]:
+            return None
+        text = left["text"] + right["text"][max(0, left["end"] - right["start"]):]
+        end = max(left["end"], right["end"])
+    else:
+        if right.get("chunk_index") != left.get("chunk_index", -2) + 1:
+            return None
+        text = left["text"] + right["text"][_text_overlap(left["text"], right["text"]):]
+        end = None
+    merged = {**left, "text": text, "score": max(left["score"], right["score"])}
+    if end is not None:
+        merged["end"] = end
+    if "chunk_index" in right:
+        merged["chunk_index"] = right["chunk_index"]
+    return merged
+
+def merge_chunks(retrieved_chunks):
+    """Drops duplicates and merges overlapping or adjacent chunks from the same document page."""
+    by_document = {}
+    loose = []
+    seen_texts = set()
+    for chunk in retrieved_chunks:
+        if chunk["text"] in seen_texts:
+            continue
+        seen_texts.add(chunk["text"])
+        if "document_id" in chunk and ("start" in chunk or "chunk_index" in chunk):
+            # Spans are offsets within a page (ingest chunks each page separately), so they
+            # are only comparable between chunks of the same page
+            page = chunk.get("page_number") if "start" in chunk else None
+            by_document.setdefault((chunk["document_id"], page), []).append(chunk)
+        else:
+            loose.append(chunk)
+
+    merged = list(loose)
+    for chunks in by_document.values():
+        chunks.sort(key=lambda chunk: (chunk.get("start", 0), chunk.get("chunk_index", 0)))
+        current = chunks[0]
+        for chunk in chunks[1:]:
+            combined = _merge_pair(current, chunk)
+            if combined is None:
+                merged.append(current)
+                current = chunk
+            else:
+                current = combined
+        merged.append(current)
+    return merged
+
+def assemble_context(retrieved_chunks, token_budget=CONTEXT_TOKEN_BUDGET, count_tokens=approx_token_count):
+    """
+    Returns the chunk texts to put in the prompt: deduplicated and merged,
+    highest score first, packed greedily until `token_budget` is used up.
+    """
+    packed = []
+    used = 0
+    for chunk in sorted(merge_chunks(retrieved_chunks), key=lambda chunk: chunk["score"], reverse=True):
+        tokens = count_tokens(chunk["text"])
+        if used + tokens > token_budget:
+            continue
+        packed.append(chunk["text"])
+        used += tokens
+    return packed
@@ -1,26 +1,28 @@
+import hashlib
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from PyPDF2 import PdfReader
-from pdf2image import convert_from_path
 import pdfplumber
 import pytesseract
 from PIL import Image
 import camelot
+from page_rasterizer import POOL_CONTEXT, PageRasterizer, render_slots, share_render_slots
 
 def extract_Text_from_pdf(pdf_path):
     reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text()
-    return text
-
-def extract_images_from_pdf(pdf_path):
-    images = convert_from_path(pdf_path, poppler_path=r"C:\Users\HP\Downloads\Release-24.08.0-0\poppler-24.08.0\Library\bin")
-    image_paths = []
+    return "".join(page.extract_text() or "" for page in reader.pages)
 
-    for i, image in enumerate(images):
-        image_path = f"page_{i}.png"
-        image.save(image_path, "PNG")
-        image_paths.append(image_path)
-    return image_paths
+def extract_images_from_pdf(pdf_path, job_dir=None, dpi=150, grayscale=False):
+    """
+    Returns a PageRasterizer for the PDF; pages are rendered as they are asked
+    for, e.g. `with extract_images_from_pdf(path) as pages: for image_path in
+    pages.page_paths(): ...`. Without `job_dir` the images go into a temporary
+    directory that is removed when the `with` block ends.
+    """
+    return PageRasterizer(pdf_path, dpi=dpi, grayscale=grayscale, job_dir=job_dir)
 
 def extract_tables_from_pdf(pdf_path):
     with pdfplumber.open(pdf_path) as pdf:
@@ -40,10 +42,120 @@ def ocr_on_image(image_path):
     text = pytesseract.image_to_string(image=img)
     return text
 
-def check_document_type(pdf_path):
-    text = extract_Text_from_pdf(pdf_path)
-    images = extract_images_from_pdf(pdf_path)
-    tables = extract_tables_from_pdf(pdf_path)
+OCR_CACHE_DIR = os.path.join(".rag", "ocr_cache")
+MIN_TEXT_CHARS = 40
+MIN_CLEAN_RATIO = 0.7
+
+def needs_ocr(text, min_chars=MIN_TEXT_CHARS, min_clean_ratio=MIN_CLEAN_RATIO):
+    """True when a page's text layer is missing or looks like extraction garbage."""
+    stripped = text.strip()
+    if len(stripped) < min_chars:
+        return True
+    # Unmapped glyphs come out as "(cid:123)" or replacement characters
+    if stripped.count("(cid:") * 8 > len(stripped) * (1 - min_clean_ratio):
+        return True
+    clean = sum(1 for c in stripped if c.isalnum() or c.isspace() or c in ".,;:!?'\"()-%/")
+    if clean / len(stripped) < min_clean_ratio:
+        return True
+    # Real text has words; garbage is mostly single characters split by spaces
+    words = stripped.split()
+    return sum(1 for word in words if len(word) > 1) < 0.5 * len(words)
+
+def ocr_image_cached(image, cache_dir=OCR_CACHE_DIR):
+    """Runs Tesseract on a PIL image, reusing earlier results for identical page images."""
+    digest = hashlib.sha256(f"{image.mode}{image.size}".encode("utf-8") + image.tobytes()).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{digest}.txt")
+    if os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            return f.read()
+
+    text = pytesseract.image_to_string(image=image)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, cache_path)
+    return text
+
+# Each pool worker opens the PDF once and keeps it for every page it is handed
+_worker_pdf = None
+_worker_rasterizer = None
+
+def _init_page_worker(pdf_path, image_dir, dpi, grayscale, slots):
+    global _worker_pdf, _worker_rasterizer
+    # The pool already provides the parallelism; keep Tesseract to one thread per worker
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    # MAX_CONCURRENT_RENDERS applies across all workers and jobs, not per worker
+    share_render_slots(slots)
+    _worker_pdf = pdfplumber.open(pdf_path)
+    _worker_rasterizer = PageRasterizer(pdf_path, dpi=dpi, grayscale=grayscale, job_dir=image_dir)
+
+def _process_page(page_number, render, ocr):
+    page = _worker_pdf.pages[page_number]
+    result = {
+        "page_number": page_number,
+        "text": page.extract_text() or "",
+        "table": page.extract_table(),
+        "image_path": None,
+        "ocr_text": None,
+        "text_source": "text_layer",
+    }
+    # Drop the parsed layout objects so long documents don't accumulate them
+    page.close()
+
+    # Pages are only rasterized when a page image or OCR was asked for
+    if render:
+        result["image_path"] = _worker_rasterizer.page_path(page_number)
+    if ocr is True or (ocr == "auto" and needs_ocr(result["text"])):
+        image = Image.open(result["image_path"]) if render else _worker_rasterizer.render(page_number)
+        result["ocr_text"] = ocr_image_cached(image)
+        image.close()
+        if needs_ocr(result["text"]):
+            result["text"] = result["ocr_text"]
+            result["text_source"] = "ocr"
+    return result
+
+def stream_pdf_pages(pdf_path, workers=None, max_in_flight=None, image_dir=None, ocr="auto", dpi=300, grayscale=True):
+    """
+    Yields one dict per page (page_number, text, table, image_path, ocr_text,
+    text_source) in page order. Pages are processed in a process pool and at
+    most `max_in_flight` results are held at a time, so memory does not grow
+    with the page count. Page images are written to `image_dir` only when one
+    is given. With ocr="auto" only pages without a usable text layer are OCR'd.
+    """
+    page_count = len(PdfReader(pdf_path).pages)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+    # OCR-only renders stay in memory and never touch the disk
+    render = image_dir is not None
+    if render:
+        os.makedirs(image_dir, exist_ok=True)
+
+    initargs = (pdf_path, image_dir, dpi, grayscale, render_slots())
+    with ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT, initializer=_init_page_worker,
+                             initargs=initargs) as pool:
+        pending = deque()
+        for page_number in range(page_count):
+            pending.append(pool.submit(_process_page, page_number, render, ocr))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def check_document_type(pdf_path, render_images=False, workers=None, image_dir=None):
+    # The returned page images outlive this call, so their directory has to come from (and be removed by) the caller
+    if render_images and image_dir is None:
+        raise ValueError("render_images=True needs an image_dir for the page images, e.g. a tempfile.TemporaryDirectory().")
+    if not render_images:
+        image_dir = None
+    texts, images, tables = [], [], []
+    for page in stream_pdf_pages(pdf_path, workers=workers, image_dir=image_dir, grayscale=False):
+        texts.append(page["text"])
+        if page["image_path"]:
+            images.append(page["image_path"])
+        if page["table"]:
+            tables.append(page["table"])
+    text = "".join(texts)
     # print("Text: ", text)
     # print("Images: ", images)
     # print("Tables: ", tables)
@@ -71,11 +183,73 @@ def text_chunking(text, max_chunk_size= 250, overlap=50):
     start = 0
     while start < len(text):
         end = start + max_chunk_size 
-        chunk = text[start:end+1]
+        chunk = text[start:end]
         chunks.append(chunk)
         start += max_chunk_size - overlap
     return chunks
     
+# Sentence ends and paragraph breaks are the preferred places to cut a chunk
+SENTENCE_END = re.compile(r"[.!?][\"')\]]*(?=\s)|\n\s*\n")
+
+def token_chunking(text, tokenizer, max_tokens=None, overlap_tokens=64):
+    """
+    Yields chunks that fit the embedding model's window, as dicts with the chunk
+    text, its character span (start, end) in `text` and its token count. The
+    text is tokenized once; chunks end on sentence boundaries where possible,
+    otherwise on a word boundary, and overlap by about `overlap_tokens`.
+    """
+    if max_tokens is None:
+        max_tokens = min(tokenizer.model_max_length, 512) - tokenizer.num_special_tokens_to_add()
+    encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+    offsets = np.asarray(encoding["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+    n_tokens = len(offsets)
+    if n_tokens == 0:
+        return
+
+    # Token index right after each sentence end, i.e. the valid exclusive chunk ends
+    sentence_ends = np.fromiter((m.end() for m in SENTENCE_END.finditer(text)), dtype=np.int64)
+    boundaries = np.unique(np.searchsorted(offsets[:, 1], sentence_ends, side="left") + 1)
+    boundaries = boundaries[(boundaries > 0) & (boundaries < n_tokens)]
+
+    # Tokens that start a new word; cutting anywhere else would split a word
+    word_ids = np.array([-1 if w is None else w for w in encoding.word_ids()], dtype=np.int64)
+    word_starts = np.flatnonzero(np.r_[True, word_ids[1:] != word_ids[:-1]])
+
+    start = 0
+    while start < n_tokens:
+        limit = min(start + max_tokens, n_tokens)
+        end = limit
+        if limit < n_tokens:
+            # Prefer the last sentence end in the back half of the window
+            candidates = boundaries[(boundaries > start + max_tokens // 2) & (boundaries <= limit)]
+            if len(candidates):
+                end = int(candidates[-1])
+            else:
+                candidates = word_starts[(word_starts > start) & (word_starts <= limit)]
+                if len(candidates):
+                    end = int(candidates[-1])
+
+        char_start, char_end = int(offsets[start, 0]), int(offsets[end - 1, 1])
+        yield {
+            "text": text[char_start:char_end],
+            "start": char_start,
+            "end": char_end,
+            "token_count": end - start,
+        }
+        if end >= n_tokens:
+            break
+
+        # Start the next chunk on the sentence start closest to the requested overlap,
+        # allowing up to twice the overlap, else on the first word inside the overlap
+        target = end - overlap_tokens
+        candidates = boundaries[(boundaries >= end - 2 * overlap_tokens) & (boundaries > start) & (boundaries < end)]
+        if not len(candidates):
+            candidates = word_starts[(word_starts >= target) & (word_starts > start) & (word_starts < end)]
+        if len(candidates):
+            start = int(candidates[np.argmin(np.abs(candidates - target))])
+        else:
+            start = end
+
 def displaying_chunks(chunks):
     print("Length of Chunks before embeddings: ", len(chunks))
     for i, chunk  in enumerate(chunks):
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+CACHE_DIR = os.path.join(".rag", "embedding_cache")
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache on disk. Vectors live in a fixed-size
+    memory-mapped float32 matrix; a small SQLite index maps chunk hashes to
+    rows and tracks last use so the least recently used rows are recycled
+    once `max_entries` is reached.
+    """
+
+    def __init__(self, model_id, tokenizer_config, dim, max_entries=200_000, cache_dir=CACHE_DIR):
+        # Any change to the model or tokenizer settings gets a separate namespace
+        namespace = hashlib.sha256(
+            json.dumps({"model": model_id, "tokenizer": tokenizer_config}, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()[:16]
+        self.path = os.path.join(cache_dir, namespace)
+        os.makedirs(self.path, exist_ok=True)
+        self.dim = dim
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        vectors_path = os.path.join(self.path, "vectors.f32")
+        # Grown in place rather than opened with "w+", which would truncate a file another worker just created
+        with open(vectors_path, "ab") as f:
+            if f.tell() < max_entries * dim * 4:
+                f.truncate(max_entries * dim * 4)
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(max_entries, dim))
+
+        # Pre-forked workers share this index; transactions are managed explicitly (see put_many)
+        self._db = sqlite3.connect(os.path.join(self.path, "index.sqlite"), check_same_thread=False,
+                                   timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER UNIQUE, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+    def get_many(self, texts):
+        """Returns (embeddings, found) where found[i] tells whether row i was cached."""
+        keys = [chunk_hash(text) for text in texts]
+        embeddings = np.zeros((len(keys), self.dim), dtype=np.float32)
+        found = np.zeros(len(keys), dtype=bool)
+        with self._lock:
+            # Lookup and copy share put_many's write lock: another process can't evict and
+            # overwrite a slot between reading its key and reading its vector
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                slots = {}
+                unique_keys = list(set(keys))
+                for start in range(0, len(unique_keys), 500):
+                    part = unique_keys[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(part))})", part
+                    ).fetchall()
+                    slots.update(rows)
+                for i, key in enumerate(keys):
+                    slot = slots.get(key)
+                    if slot is not None:
+                        embeddings[i] = self._vectors[slot]
+                        found[i] = True
+                now = time.time()
+                self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in slots])
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            self.hits += int(found.sum())
+            self.misses += int(len(keys) - found.sum())
+        return embeddings, found
+
+    def put_many(self, texts, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            now = time.time()
+            # The write lock is taken before any slot is chosen, so two processes can't pick the same one
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for text, embedding in zip(texts, embeddings):
+                    key = chunk_hash(text)
+                    row = self._db.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+                    if row is None:
+                        slot = self._free_slot()
+                        self._db.execute("INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)", (key, slot, now))
+                    else:
+                        slot = row[0]
+                        self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+                    self._vectors[slot] = embedding
+                self._vectors.flush()
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _free_slot(self):
+        # Only called inside put_many's write transaction
+        (count,) = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if count < self.max_entries:
+            # Rows are only removed by eviction, which reuses the slot, so slots stay dense
+            return count
+        key, slot = self._db.execute("SELECT key, slot FROM entries ORDER BY last_used LIMIT 1").fetchone()
+        self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self.evictions += 1
+        return slot
+
+    def stats(self):
+        with self._lock:
+            (size,) = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
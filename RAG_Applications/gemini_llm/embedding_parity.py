@@ -0,0 +1,46 @@
+"""
+Checks that the configured EMBEDDING_BACKEND matches the fp32 PyTorch model.
+
+    EMBEDDING_BACKEND=onnx-int8 python embedding_parity.py
+"""
+import sys
+import time
+import numpy as np
+import torch
+import openai_clip
+from openai_clip import load_embedding_model
+
+SAMPLE_TEXTS = [
+    "Paracetamol 500 mg tablets are used to treat mild to moderate pain and fever.",
+    "Replace the filter cartridge AB-1234 every six months or after 2000 litres.",
+    "The warranty does not cover damage caused by improper installation.",
+    "Store below 25°C in a dry place, away from direct sunlight.",
+    "In case of overdose, seek medical advice immediately even if you feel well.",
+    "Short query",
+]
+
+def check_backend_parity(texts=SAMPLE_TEXTS, min_cosine=0.99):
+    """Returns the per-text cosine similarity between the active backend and fp32 reference embeddings."""
+    start = time.perf_counter()
+    candidate = openai_clip.embed_queries(texts)
+    candidate_seconds = time.perf_counter() - start
+
+    reference_model, reference_device = load_embedding_model("torch")
+    with openai_clip.tokenizer_lock:
+        inputs = openai_clip.get_tokenizer()(list(texts), return_tensors="pt", padding=True, truncation=True)
+    inputs = inputs.to(reference_device)
+    start = time.perf_counter()
+    with torch.inference_mode():
+        reference = reference_model(**inputs)[0][:, 0]
+        reference = torch.nn.functional.normalize(reference, p=2, dim=1).float().cpu().numpy()
+    reference_seconds = time.perf_counter() - start
+
+    cosines = np.sum(candidate * reference, axis=1)
+    print(f"Backend {openai_clip.EMBEDDING_BACKEND}: min cosine {cosines.min():.5f}, mean {cosines.mean():.5f}")
+    print(f"Time: {candidate_seconds:.3f}s vs fp32 {reference_seconds:.3f}s")
+    if cosines.min() < min_cosine:
+        raise AssertionError(f"Embeddings drift from fp32: min cosine {cosines.min():.5f} < {min_cosine}")
+    return cosines
+
+if __name__ == "__main__":
+    check_backend_parity(min_cosine=float(sys.argv[1]) if len(sys.argv) > 1 else 0.99)
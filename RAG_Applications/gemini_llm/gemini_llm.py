@@ -1,34 +1,37 @@
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai
+from context_builder import CONTEXT_TOKEN_BUDGET, assemble_context
+from resources import resources
 
 load_dotenv()
 
-api_key = os.environ.get("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("GEMINI_API_KEY is not set in the environment variables.")
-
-genai.configure(api_key=api_key)
-
-def LLM(retrieved_chunks, user_query):
-  generation_config = {
-      "temperature": 1,
-      "top_p": 0.95,
-      "top_k": 40,
-      "max_output_tokens": 1000,
-      "response_mime_type": "text/plain",
-  }
-
-  model = genai.GenerativeModel(
-      model_name="gemini-1.5-flash",
+generation_config = {
+    "temperature": 1,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 1000,
+    "response_mime_type": "text/plain",
+}
+
+def _load_gemini_model():
+  api_key = os.environ.get("GEMINI_API_KEY")
+  if not api_key:
+      raise ValueError("GEMINI_API_KEY is not set in the environment variables.")
+
+  # Configured once per process; the gRPC channel is reused by every call
+  genai.configure(api_key=api_key, transport="grpc")
+  return genai.GenerativeModel(
+      model_name=os.environ.get("GEMINI_MODEL", "gemini-1.5-flash"),
       generation_config=generation_config,
   )
 
-  chat_session = model.start_chat(history=[])
-  conversation_history = []
+# gRPC channels don't survive fork, so every worker process configures its own
+resources.register("gemini_model", _load_gemini_model, fork_safe=False)
 
-  # context = "\n".join(retrieved_chunks)
-  context = "\n".join(chunk["text"] for chunk in retrieved_chunks)
+def build_prompt(retrieved_chunks, user_query, token_budget=CONTEXT_TOKEN_BUDGET):
+  # Overlapping chunks are merged and the rest packed best-first into the token budget
+  context = "\n\n".join(assemble_context(retrieved_chunks, token_budget=token_budget))
 
   prompt = f"""
           You are a highly knowledgeable assistant with expertise in analyzing and synthesizing information. 
@@ -47,19 +50,31 @@ def LLM(retrieved_chunks, user_query):
 
           Provide your response below:
           """
+  return prompt
 
-  conversation_history.append({"role": "user", "parts": user_query})
+def _chunk_text(chunk):
+  # Chunks without parts (e.g. a final chunk carrying only the finish reason) have no text
+  return "".join(part.text for part in chunk.parts)
 
-  response = chat_session.send_message(prompt)
+def LLM(retrieved_chunks, user_query):
+  response = resources.get("gemini_model").generate_content(build_prompt(retrieved_chunks, user_query))
+  return response.text
 
-  print("Response from Gemini:")
+def stream_LLM(retrieved_chunks, user_query):
+  """Yields the answer text piece by piece as Gemini generates it."""
+  response = resources.get("gemini_model").generate_content(build_prompt(retrieved_chunks, user_query), stream=True)
   for chunk in response:
-      print(chunk.text)
-      print("_" * 80)
-
-  conversation_history.append({"role": "model", "parts": response.text})
-
-  print("Conversation History:")
-  for message in conversation_history:
-      print(f"{message['role'].capitalize()}: {message['parts']}")
-  
\ No newline at end of file
+      text = _chunk_text(chunk)
+      if text:
+          yield text
+
+async def LLM_async(retrieved_chunks, user_query):
+  response = await resources.get("gemini_model").generate_content_async(build_prompt(retrieved_chunks, user_query))
+  return response.text
+
+async def stream_LLM_async(retrieved_chunks, user_query):
+  response = await resources.get("gemini_model").generate_content_async(build_prompt(retrieved_chunks, user_query), stream=True)
+  async for chunk in response:
+      text = _chunk_text(chunk)
+      if text:
+          yield text
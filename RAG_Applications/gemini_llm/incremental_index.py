@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+from collection_names import validate_collection_name
+from qdrant import chunk_keys, chunk_payloads, chunk_point_id
+from vector_store import get_vector_store
+
+MANIFEST_DIR = os.path.join(".rag", "manifests")
+
+# Chunks embedded and upserted per step; progress is reported after each one
+INDEX_BATCH_SIZE = 256
+
+def _manifest_path(collection_name, document_id):
+    # document_id comes from the client; hashing it keeps the manifest inside the collection directory
+    name = hashlib.sha256(str(document_id).encode("utf-8")).hexdigest()
+    return os.path.join(MANIFEST_DIR, validate_collection_name(collection_name), f"{name}.json")
+
+def _read_manifest(collection_name, document_id):
+    path = _manifest_path(collection_name, document_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def load_manifest(collection_name, document_id, vector_store=None):
+    """Returns {chunk_key: chunk_index} for the indexed version of a document."""
+    manifest = _read_manifest(collection_name, document_id)
+    if manifest is not None:
+        return manifest["chunks"]
+
+    # No manifest yet (e.g. stored with store_chunk_embedding_in_db): rebuild it from the payloads
+    vector_store = vector_store or get_vector_store()
+    return {
+        payload["chunk_key"]: payload.get("chunk_index")
+        for _, payload in vector_store.document_payloads(collection_name, document_id)
+        if "chunk_key" in payload
+    }
+
+def save_manifest(collection_name, document_id, manifest, chunk_metadata=None):
+    path = _manifest_path(collection_name, document_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"document_id": document_id, "chunks": manifest, "chunk_metadata": chunk_metadata}, f)
+    os.replace(tmp_path, path)
+
+def index_document(collection_name, document_id, chunk_texts, embed_fn, metadata=None, chunk_metadata=None, vector_store=None,
+                   progress=None, batch_size=INDEX_BATCH_SIZE):
+    """
+    Brings a document's points in line with `chunk_texts`: only new or changed
+    chunks go through `embed_fn` and get upserted, chunks that disappeared are
+    deleted, and unchanged chunks that moved (new chunk_index, page or span)
+    just get their payload updated. Writes go through `vector_store` (the
+    VECTOR_STORE backend by default), which keeps BM25 in step. New chunks
+    are embedded and upserted `batch_size` at a time, calling progress(done,
+    total) after each batch; an exception raised there (e.g. a cancelled job)
+    stops indexing before the manifest is saved.
+    """
+    vector_store = vector_store or get_vector_store()
+    old_manifest = load_manifest(collection_name, document_id, vector_store)
+    # None for manifests written before metadata was recorded: every kept chunk gets its payload refreshed
+    old_metadata = (_read_manifest(collection_name, document_id) or {}).get("chunk_metadata")
+    keys = chunk_keys(chunk_texts)
+    new_manifest = {key: i for i, key in enumerate(keys)}
+    new_metadata = {
+        key: {**(metadata or {}), **(chunk_metadata[i] if chunk_metadata is not None else {})}
+        for i, key in enumerate(keys)
+    }
+
+    added = [i for i, key in enumerate(keys) if key not in old_manifest]
+    removed = [key for key in old_manifest if key not in new_manifest]
+    moved = [
+        key for key in new_manifest
+        if key in old_manifest
+        and (old_manifest[key] != new_manifest[key] or old_metadata is None or old_metadata.get(key) != new_metadata[key])
+    ]
+
+    payloads = chunk_payloads(chunk_texts, document_id, metadata, chunk_metadata)
+    for start in range(0, len(added), batch_size):
+        batch = added[start:start + batch_size]
+        embeddings = embed_fn([chunk_texts[i] for i in batch])
+        vector_store.upsert(
+            collection_name, [chunk_point_id(document_id, keys[i]) for i in batch], embeddings,
+            [payloads[i] for i in batch],
+        )
+        if progress is not None:
+            progress(start + len(batch), len(added))
+    if removed:
+        vector_store.delete(collection_name, [chunk_point_id(document_id, key) for key in removed])
+    if moved:
+        # The whole payload, so page numbers and spans follow the chunk, not just its index
+        vector_store.set_payload(
+            collection_name, [chunk_point_id(document_id, key) for key in moved],
+            [payloads[new_manifest[key]] for key in moved],
+        )
+
+    save_manifest(collection_name, document_id, new_manifest, new_metadata)
+    print(f"Indexed {document_id} in {collection_name}: {len(added)} added, {len(removed)} removed, "
+          f"{len(keys) - len(added)} unchanged.")
+    return {"added": len(added), "removed": len(removed), "moved": len(moved), "unchanged": len(keys) - len(added)}
@@ -0,0 +1,218 @@
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+JOBS_DB = os.path.join(".rag", "jobs.sqlite")
+
+# Jobs in these states are reused when the same file is uploaded again
+ACTIVE_OR_DONE = ("queued", "running", "done")
+
+# A running job whose owner hasn't sent a heartbeat for this long is considered orphaned
+LEASE_SECONDS = 60.0
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class IngestJobQueue:
+    """
+    Background ingestion with a SQLite-backed job queue, so it needs no broker
+    and survives restarts. `workers` threads each run one document at a time
+    through `run_fn(job, report)`, where report(progress, stage) records
+    progress and raises JobCancelled if the job was cancelled.
+
+    Several processes (server workers, a restarted worker) may share one
+    database: a claimed job is leased to its process, which renews the lease
+    while it runs, and only jobs whose lease expired are picked up again. Jobs
+    of one document run one at a time, in upload order. With start=False no
+    workers run until the first submit().
+    """
+
+    def __init__(self, run_fn, workers=2, db_path=JOBS_DB, poll_interval=1.0, start=True,
+                 lease_seconds=LEASE_SECONDS):
+        self.run_fn = run_fn
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._owner = None
+        self._start_lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    file_hash TEXT,
+                    file_path TEXT,
+                    file_name TEXT,
+                    user_id TEXT,
+                    collection TEXT,
+                    document_id TEXT,
+                    status TEXT,
+                    stage TEXT,
+                    progress REAL,
+                    error TEXT,
+                    cancel_requested INTEGER DEFAULT 0,
+                    created_at REAL,
+                    updated_at REAL,
+                    owner TEXT
+                )
+            """)
+            if "owner" not in {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}:
+                db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_document ON jobs (collection, document_id, created_at)")
+        if start:
+            self.ensure_workers()
+
+    def ensure_workers(self):
+        # Threads don't survive fork; a forked server worker starts its own on first use
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._wakeup = threading.Event()
+                    self._owner = f"{socket.gethostname()}:{os.getpid()}"
+                    for i in range(self.workers):
+                        threading.Thread(target=self._work, name=f"ingest-worker-{i}", daemon=True).start()
+                    threading.Thread(target=self._heartbeat, name="ingest-heartbeat", daemon=True).start()
+                    self._pid = os.getpid()
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def submit(self, file_path, file_name, user_id, collection, document_id=None):
+        """
+        Queues a file as a new version of `document_id` (default: the file
+        name, so re-uploading an edited file replaces the old version) and
+        returns (job, created). If the document's latest job is for the same
+        bytes and hasn't failed, that job is returned instead. The queue owns
+        `file_path` from here on and deletes it once the job has ended.
+        """
+        self.ensure_workers()
+        file_hash = file_sha256(file_path)
+        document_id = document_id or file_name
+        with self._connect() as db:
+            # Check and insert in one write transaction, so identical concurrent uploads create one job
+            db.execute("BEGIN IMMEDIATE")
+            latest = db.execute(
+                "SELECT * FROM jobs WHERE collection = ? AND document_id = ? ORDER BY created_at DESC LIMIT 1",
+                (collection, document_id),
+            ).fetchone()
+            if latest is not None and latest["file_hash"] == file_hash and latest["status"] in ACTIVE_OR_DONE:
+                return dict(latest), False
+            now = time.time()
+            job_id = uuid.uuid4().hex
+            db.execute(
+                "INSERT INTO jobs (id, file_hash, file_path, file_name, user_id, collection, document_id, status, "
+                "progress, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', 0, ?, ?)",
+                (job_id, file_hash, file_path, file_name, user_id, collection, document_id, now, now),
+            )
+        self._wakeup.set()
+        return self.get(job_id), True
+
+    def get(self, job_id):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def cancel(self, job_id):
+        """Cancels a queued job right away; a running job stops at its next progress report."""
+        with self._connect() as db:
+            cancelled = db.execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            ).rowcount
+            db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        job = self.get(job_id)
+        if cancelled:
+            self._remove_upload(job)
+        return job
+
+    @staticmethod
+    def _remove_upload(job):
+        try:
+            os.remove(job["file_path"])
+        except (FileNotFoundError, TypeError):
+            pass
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as db:
+            # Only while this process still holds the lease; an expired one belongs to whoever re-claimed the job
+            return db.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND owner = ?", (*fields.values(), job_id, self._owner)
+            ).rowcount
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            try:
+                with self._connect() as db:
+                    db.execute(
+                        "UPDATE jobs SET updated_at = ? WHERE status = 'running' AND owner = ?", (time.time(), self._owner)
+                    )
+            except sqlite3.OperationalError as e:
+                print(f"Ingest heartbeat failed: {e}")
+
+    def _claim(self):
+        with self._connect() as db:
+            # BEGIN IMMEDIATE takes the write lock so two workers can't claim the same job
+            db.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            # Jobs of a process that stopped renewing its lease start over (or end, if cancelled meanwhile)
+            db.execute(
+                "UPDATE jobs SET status = CASE WHEN cancel_requested THEN 'cancelled' ELSE 'queued' END, "
+                "owner = NULL, stage = NULL, progress = 0, updated_at = ? WHERE status = 'running' AND updated_at < ?",
+                (now, now - self.lease_seconds),
+            )
+            # Oldest queued job whose document isn't being indexed already
+            row = db.execute(
+                "SELECT * FROM jobs AS j WHERE status = 'queued' AND NOT EXISTS ("
+                "SELECT 1 FROM jobs AS r WHERE r.status = 'running' AND r.collection = j.collection "
+                "AND r.document_id = j.document_id) ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, updated_at = ? WHERE id = ?", (self._owner, now, row["id"])
+            )
+            return dict(row)
+
+    def _work(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            def report(progress, stage, job_id=job["id"]):
+                # Losing the lease stops the job like a cancellation; its new owner runs it again
+                if not self._update(job_id, progress=progress, stage=stage) or self.get(job_id)["cancel_requested"]:
+                    raise JobCancelled()
+
+            try:
+                self.run_fn(job, report)
+                finished = self._update(job["id"], status="done", progress=1.0, stage="done")
+            except JobCancelled:
+                finished = self._update(job["id"], status="cancelled")
+            except Exception as e:
+                finished = self._update(job["id"], status="failed", error=str(e))
+            if finished:
+                self._remove_upload(job)
@@ -0,0 +1,41 @@
+from PyPDF2 import PdfReader
+from docs_preprocessing import stream_pdf_pages, token_chunking
+from incremental_index import index_document
+from openai_clip import embedding_the_chunks, get_tokenizer, tokenizer_lock
+from vector_store import get_vector_store
+
+def ingest_pdf(job, report):
+    """parse -> chunk -> embed -> upsert for one queued upload (see IngestJobQueue)."""
+    vector_store = get_vector_store()
+    vector_store.create_collection(job["collection"])
+    page_count = len(PdfReader(job["file_path"]).pages) or 1
+
+    tokenizer = get_tokenizer()
+    chunk_texts, chunk_metadata = [], []
+    for page in stream_pdf_pages(job["file_path"]):
+        # The tokenizer is shared with query threads; chunking runs under its lock
+        with tokenizer_lock:
+            chunks = list(token_chunking(page["text"], tokenizer))
+        for chunk in chunks:
+            chunk_texts.append(chunk["text"])
+            chunk_metadata.append({
+                "page_number": page["page_number"],
+                "start": chunk["start"],
+                "end": chunk["end"],
+                "text_source": page["text_source"],
+            })
+        # Parsing is roughly the first half of the work, embedding and upserting the rest
+        report(0.5 * (page["page_number"] + 1) / page_count, "parsing")
+
+    report(0.5, "indexing")
+    index_document(
+        job["collection"],
+        job["document_id"],
+        chunk_texts,
+        embedding_the_chunks,
+        metadata={"file_name": job["file_name"], "user_id": job["user_id"]},
+        chunk_metadata=chunk_metadata,
+        vector_store=vector_store,
+        # Embedding and upserting is the second half; each batch is also a cancellation point
+        progress=lambda done, total: report(0.5 + 0.5 * done / total, "indexing"),
+    )
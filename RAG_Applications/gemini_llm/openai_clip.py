@@ -1,39 +1,168 @@
 from transformers import AutoModel, AutoTokenizer
+import os
+import threading
+import numpy as np
 import torch
-
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print("Device: ",device)
+from embedding_cache import EmbeddingCache
+from resources import resources
 
 # model = AutoModel.from_pretrained("openai/clip-vit-base-patch16").to(device)
 # processor = AutoImageProcessor.from_pretrained("openai/clip-vit-base-patch16")
 # tokenizer = AutoTokenizer.from_pretrained("openai/clip-vit-base-patch16")
 
-model = AutoModel.from_pretrained(
-    "BAAI/bge-large-en-v1.5",
-    cache_dir=r"E:\RAG\huggingface_cache",
-    device_map="auto")
+MODEL_NAME = os.environ.get("EMBEDDING_MODEL", "BAAI/bge-large-en-v1.5")
+# None uses the default Hugging Face cache
+HF_CACHE_DIR = os.environ.get("HF_CACHE_DIR") or None
+
+# "torch" (fp32), "torch-int8" (dynamic int8 Linear layers) or "onnx-int8" (ONNX Runtime, needs optimum[onnxruntime])
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+ONNX_EXPORT_DIR = os.path.join(".rag", "onnx")
+
+def _load_onnx_int8(model_name, cache_dir):
+    try:
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError:
+        raise ImportError("EMBEDDING_BACKEND=onnx-int8 requires `pip install optimum[onnxruntime]`.")
+
+    export_dir = os.path.join(ONNX_EXPORT_DIR, model_name.replace("/", "--"))
+    quantized_dir = os.path.join(export_dir, "int8")
+    if not os.path.exists(os.path.join(quantized_dir, "model_quantized.onnx")):
+        # One-off export and dynamic int8 quantization, reused on later starts
+        ORTModelForFeatureExtraction.from_pretrained(model_name, export=True, cache_dir=cache_dir).save_pretrained(export_dir)
+        quantizer = ORTQuantizer.from_pretrained(export_dir)
+        quantizer.quantize(save_dir=quantized_dir, quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=True))
+    return ORTModelForFeatureExtraction.from_pretrained(quantized_dir, file_name="model_quantized.onnx")
+
+def load_embedding_model(backend=EMBEDDING_BACKEND, model_name=MODEL_NAME, cache_dir=HF_CACHE_DIR):
+    """Returns (model, device) for the selected inference backend."""
+    if backend == "torch":
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        return AutoModel.from_pretrained(model_name, cache_dir=cache_dir, device_map="auto"), device
+    if backend == "torch-int8":
+        fp32_model = AutoModel.from_pretrained(model_name, cache_dir=cache_dir).eval()
+        return torch.ao.quantization.quantize_dynamic(fp32_model, {torch.nn.Linear}, dtype=torch.qint8), torch.device("cpu")
+    if backend == "onnx-int8":
+        return _load_onnx_int8(model_name, cache_dir), torch.device("cpu")
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+
+def _load_tokenizer():
+    return AutoTokenizer.from_pretrained(MODEL_NAME, cache_dir=HF_CACHE_DIR)
+
+def _load_embedding_cache():
+    tokenizer = get_tokenizer()
+    # Re-ingesting the same or slightly edited documents skips the forward pass for known chunks
+    return EmbeddingCache(
+        model_id=f"{MODEL_NAME}:{EMBEDDING_BACKEND}",
+        tokenizer_config={
+            "class": type(tokenizer).__name__,
+            "model_max_length": tokenizer.model_max_length,
+            "do_lower_case": getattr(tokenizer, "do_lower_case", None),
+            "vocab_size": tokenizer.vocab_size,
+        },
+        dim=get_model().config.hidden_size)
+
+# Nothing is loaded at import time; the first embedding call (or resources.warm_up()) does it
+resources.register("embedding_model", lambda: load_embedding_model())
+resources.register("tokenizer", _load_tokenizer)
+# The cache holds a SQLite connection, which must not cross a fork
+resources.register("embedding_cache", _load_embedding_cache, fork_safe=False, required=False)
+
+def get_model():
+    return resources.get("embedding_model")[0]
+
+def get_device():
+    return resources.get("embedding_model")[1]
 
-tokenizer = AutoTokenizer.from_pretrained("BAAI/bge-large-en-v1.5",cache_dir=r"E:\RAG\huggingface_cache")
+def get_tokenizer():
+    return resources.get("tokenizer")
 
-def embedding_the_chunks(chunks):
-    chunk_embeddings = []
-    for chunk in chunks:
-        inputs = tokenizer(chunk, return_tensors="pt", padding=True, truncation=True).to(device)
-        with torch.no_grad():
-            text_outputs = model(**inputs)  
-            sentence_embeddings = text_outputs[0][:, 0]
+# Fast (Rust) tokenizers fail with "Already borrowed" when one instance is used from two
+# threads at once; the query micro-batcher, batch queries and ingest workers all share one,
+# so every call into it holds this lock (forward passes don't)
+tokenizer_lock = threading.Lock()
+
+def get_embedding_cache():
+    return resources.get("embedding_cache")
+
+# Padded tokens per forward pass (batch_size * longest sequence in the batch)
+MAX_BATCH_TOKENS = 8192
+MAX_BATCH_SIZE = 64
+
+def _length_bucketed_batches(lengths, max_batch_tokens=MAX_BATCH_TOKENS, max_batch_size=MAX_BATCH_SIZE):
+    # Sorting by length keeps padding small: every batch holds chunks of similar size
+    order = np.argsort(lengths, kind="stable")
+    batch = []
+    for idx in order:
+        # Chunks come in ascending order, so the current one is the longest in the batch
+        padded_tokens = (len(batch) + 1) * lengths[idx]
+        if batch and (padded_tokens > max_batch_tokens or len(batch) >= max_batch_size):
+            yield batch
+            batch = []
+        batch.append(int(idx))
+    if batch:
+        yield batch
+
+def _encode_inputs(inputs):
+    inputs = inputs.to(get_device())
+    with torch.inference_mode():
+        text_outputs = get_model()(**inputs)
+        sentence_embeddings = text_outputs[0][:, 0]
         sentence_embeddings = torch.nn.functional.normalize(sentence_embeddings, p=2, dim=1)
+    # One device -> host copy per batch instead of one per chunk
+    return sentence_embeddings.to(torch.float32).cpu().numpy()
+
+def _encode_batch(encoded, batch):
+    features = [{key: encoded[key][i] for key in encoded.keys()} for i in batch]
+    with tokenizer_lock:
+        inputs = get_tokenizer().pad(features, padding=True, return_tensors="pt")
+    return _encode_inputs(inputs)
 
-            #normalized_embeddings = text_outputs / text_outputs.norm(dim=-1, keepdim=True)
-        embeddings = sentence_embeddings.squeeze(0).cpu().tolist()  # Flatten
-        chunk_embeddings.append(embeddings)
-            
-# # Convert embeddings to a Python list or numpy array
-# embeddings = normalized_embeddings.squeeze(0).cpu().tolist()
+def embed_queries(queries, max_batch_size=MAX_BATCH_SIZE):
+    """Embeds query strings with one forward pass per `max_batch_size` queries."""
+    queries = list(queries)
+    if not queries:
+        return np.empty((0, get_model().config.hidden_size), dtype=np.float32)
+    tokenizer = get_tokenizer()
+    embeddings = []
+    for start in range(0, len(queries), max_batch_size):
+        with tokenizer_lock:
+            inputs = tokenizer(queries[start:start + max_batch_size], return_tensors="pt", padding=True, truncation=True)
+        embeddings.append(_encode_inputs(inputs))
+    return np.concatenate(embeddings)
+
+def stream_chunk_embeddings(chunks, max_batch_tokens=MAX_BATCH_TOKENS, max_batch_size=MAX_BATCH_SIZE):
+    """Yields (chunk_indices, embeddings) one batch at a time, shortest chunks first."""
+    chunks = list(chunks)
+    if not chunks:
+        return
+    # Tokenize everything once; batches are padded from these ids
+    with tokenizer_lock:
+        encoded = get_tokenizer()(chunks, truncation=True)
+    lengths = np.fromiter((len(ids) for ids in encoded["input_ids"]), dtype=np.int64, count=len(chunks))
+    for batch in _length_bucketed_batches(lengths, max_batch_tokens, max_batch_size):
+        yield batch, _encode_batch(encoded, batch)
+
+def embedding_the_chunks(chunks, max_batch_tokens=MAX_BATCH_TOKENS, max_batch_size=MAX_BATCH_SIZE, use_cache=True):
+    chunks = list(chunks)
+    cache = get_embedding_cache() if use_cache else None
+    if cache is not None:
+        chunk_embeddings, found = cache.get_many(chunks)
+        missing = np.flatnonzero(~found)
+    else:
+        chunk_embeddings = np.empty((len(chunks), get_model().config.hidden_size), dtype=np.float32)
+        missing = np.arange(len(chunks))
+
+    missing_chunks = [chunks[i] for i in missing]
+    for batch, embeddings in stream_chunk_embeddings(missing_chunks, max_batch_tokens, max_batch_size):
+        chunk_embeddings[missing[batch]] = embeddings
+    if cache is not None and len(missing):
+        cache.put_many(missing_chunks, chunk_embeddings[missing])
 
     # Print the embedding details
-    print("Embedding size:", len(embeddings))
-    print("Chunk_Embeddings:", len(chunk_embeddings))
+    print("Embedding size:", chunk_embeddings.shape[1])
+    print("Chunk_Embeddings:", chunk_embeddings.shape[0])
+    if cache is not None:
+        print("Embedding cache:", cache.stats())
 
     return chunk_embeddings
-
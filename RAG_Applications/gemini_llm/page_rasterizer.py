@@ -0,0 +1,110 @@
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+# None means poppler is looked up on PATH
+POPPLER_PATH = os.environ.get("POPPLER_PATH") or None
+MAX_CONCURRENT_RENDERS = int(os.environ.get("MAX_CONCURRENT_RENDERS", "2"))
+
+# Start method for page pools: unlike fork, forkserver/spawn children don't inherit the
+# server's threads (embedder, ingest workers) or locks held by them
+POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+# Shared by every rasterizer in the process and handed to page pool workers, so
+# parallel uploads can't all render at once
+_render_slots = None
+_render_slots_lock = threading.Lock()
+
+def render_slots():
+    """The semaphore capping concurrent renders; a multiprocessing one so pool workers can share it."""
+    global _render_slots
+    with _render_slots_lock:
+        if _render_slots is None:
+            # Created from the pool's context so it can be handed to its workers
+            _render_slots = POOL_CONTEXT.BoundedSemaphore(MAX_CONCURRENT_RENDERS)
+        return _render_slots
+
+def share_render_slots(slots):
+    """Makes a pool worker use the parent's semaphore instead of creating its own."""
+    global _render_slots
+    _render_slots = slots
+
+class PageRasterizer:
+    """
+    Renders PDF pages only when something asks for them. Rendered files go into
+    a private per-job directory, so concurrent jobs never overwrite each other.
+    Without a `job_dir` the rasterizer creates its own and removes it in
+    cleanup(), also when used as a context manager; a given `job_dir` belongs
+    to the caller.
+    """
+
+    def __init__(self, pdf_path, dpi=150, grayscale=True, job_dir=None):
+        self.pdf_path = pdf_path
+        self.dpi = dpi
+        self.grayscale = grayscale
+        self._owns_job_dir = job_dir is None
+        self.job_dir = job_dir
+        self._paths = {}
+        self._page_count = None
+
+    @property
+    def page_count(self):
+        if self._page_count is None:
+            self._page_count = pdfinfo_from_path(self.pdf_path, poppler_path=POPPLER_PATH)["Pages"]
+        return self._page_count
+
+    def render(self, page_number):
+        """Returns a PIL image of a single page (0-based)."""
+        with render_slots():
+            return convert_from_path(
+                self.pdf_path,
+                dpi=self.dpi,
+                grayscale=self.grayscale,
+                first_page=page_number + 1,
+                last_page=page_number + 1,
+                poppler_path=POPPLER_PATH,
+            )[0]
+
+    def render_bytes(self, page_number, fmt="PNG"):
+        """Renders a page into an in-memory buffer instead of a file."""
+        image = self.render(page_number)
+        buffer = io.BytesIO()
+        image.save(buffer, fmt)
+        image.close()
+        return buffer.getvalue()
+
+    def page_path(self, page_number):
+        """Renders a page into the job directory once and returns its path."""
+        if page_number not in self._paths:
+            # The job directory is only created once a page actually lands on disk
+            if self.job_dir is None:
+                self.job_dir = tempfile.mkdtemp(prefix="rag-pages-")
+            os.makedirs(self.job_dir, exist_ok=True)
+            path = os.path.join(self.job_dir, f"page_{page_number}.png")
+            image = self.render(page_number)
+            image.save(path, "PNG")
+            image.close()
+            self._paths[page_number] = path
+        return self._paths[page_number]
+
+    def page_paths(self):
+        """Yields every page's path in order, rendering each page only when it is reached."""
+        for page_number in range(self.page_count):
+            yield self.page_path(page_number)
+
+    def cleanup(self):
+        if self._owns_job_dir and self.job_dir:
+            shutil.rmtree(self.job_dir, ignore_errors=True)
+        self._paths.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
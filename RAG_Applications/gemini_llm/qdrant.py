@@ -1,44 +1,220 @@
+import hashlib
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import (
+    BinaryQuantization, BinaryQuantizationConfig, Distance, FieldCondition, Filter, MatchValue, PointIdsList,
+    PointStruct, QuantizationSearchParams, ScalarQuantization, ScalarQuantizationConfig, ScalarType, SearchParams,
+    SearchRequest, SetPayload, SetPayloadOperation, VectorParams,
+)
+import numpy as np
+from resources import resources
+from vector_store import VectorStore
 
-client = QdrantClient(url="http://localhost:6333")
-collection_lst = client.get_collections()
+QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost:6333")
+# "int8" or "binary" to keep compact codes in RAM and the float32 vectors on disk
+QDRANT_QUANTIZATION = os.environ.get("VECTOR_QUANTIZATION") or None
 
-print(len(collection_lst.collections))
-for i in range(len(collection_lst.collections)):
-    print(collection_lst.collections[i])
+# Connects on first use rather than at import time; each forked worker gets its own client
+resources.register("qdrant_client", lambda: QdrantClient(url=QDRANT_URL), fork_safe=False,
+                   required=os.environ.get("VECTOR_STORE", "qdrant") == "qdrant")
 
-def create_user_collection(user_id):
+def get_client():
+    return resources.get("qdrant_client")
+
+def quantization_config(quantization):
+    if quantization is None:
+        return None
+    if quantization == "int8":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+    if quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unknown quantization: {quantization}")
+
+def create_user_collection(user_id, quantization=QDRANT_QUANTIZATION):
+    client = get_client()
     collection_name = f"{user_id}"
-    client.recreate_collection(
+    # Only create the collection when it is missing; existing documents stay indexed
+    if client.collection_exists(collection_name):
+        print(f"Collection {collection_name} already exists.")
+        return
+    client.create_collection(
         collection_name=collection_name,
-        vectors_config=VectorParams(size= 1024, distance=Distance.DOT, on_disk=True)
+        vectors_config=VectorParams(size= 1024, distance=Distance.DOT, on_disk=True),
+        quantization_config=quantization_config(quantization)
     )
     print(f"Collection {collection_name} created.")
 
-def store_chunk_embedding_in_db(collection_name, chunk_embeddings, chunk_texts):
-    points = [
-        PointStruct(
-            id = i,
-            vector = embedding,
-            payload={"text": chunk_texts[i]}
-        )
-        for i, embedding in enumerate(chunk_embeddings)
-    ]
-    client.upsert(collection_name=collection_name, points=points)
-    print(f"Stored {len(chunk_embeddings)} chunks in collection {collection_name}.")
+def chunk_keys(chunk_texts):
+    # Content hash plus occurrence number, so repeated chunks inside one document stay distinct
+    seen = {}
+    keys = []
+    for text in chunk_texts:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        seen[digest] = seen.get(digest, -1) + 1
+        keys.append(f"{digest}:{seen[digest]}")
+    return keys
+
+def chunk_point_id(document_id, chunk_key):
+    # Same document and chunk content -> same point id, so re-ingest overwrites instead of duplicating
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{document_id}:{chunk_key}"))
+
+def chunk_payloads(chunk_texts, document_id, metadata=None, chunk_metadata=None):
+    """Payloads stored with each chunk; `chunk_metadata` may override chunk_index/chunk_key."""
+    keys = chunk_keys(chunk_texts)
+    payloads = []
+    for i, text in enumerate(chunk_texts):
+        payload = {"text": text, "document_id": document_id, "chunk_index": i, "chunk_key": keys[i]}
+        payload.update(metadata or {})
+        if chunk_metadata is not None:
+            payload.update(chunk_metadata[i])
+        payloads.append(payload)
+    return payloads
+
+def bulk_upsert_chunks(collection_name, chunk_embeddings, chunk_texts, document_id, metadata=None,
+                       chunk_metadata=None, batch_size=256, parallel=4, retries=3, backoff=0.5, qdrant_client=None):
+    """
+    Upserts chunks in batches of `batch_size` with up to `parallel` requests in
+    flight. `metadata` is stored on every point (e.g. file name); `chunk_metadata`
+    is an optional list of per-chunk dicts (e.g. page number, character span)
+    and may override chunk_index/chunk_key when upserting a subset of a document.
+    Pass `qdrant_client` to load into another client, e.g. QdrantClient(":memory:").
+    """
+    chunk_embeddings = np.asarray(chunk_embeddings, dtype=np.float32)
+    if len(chunk_embeddings) != len(chunk_texts):
+        raise ValueError("chunk_embeddings and chunk_texts must have the same length.")
+    payloads = chunk_payloads(chunk_texts, document_id, metadata, chunk_metadata)
+    ids = [chunk_point_id(document_id, payload["chunk_key"]) for payload in payloads]
+    store = QdrantVectorStore(qdrant_client, batch_size=batch_size, parallel=parallel, retries=retries, backoff=backoff)
+    store.upsert(collection_name, ids, chunk_embeddings, payloads)
+    return len(ids)
+
+def store_chunk_embedding_in_db(collection_name, chunk_embeddings, chunk_texts, document_id=None, metadata=None):
+    if document_id is None:
+        # Without an explicit id, identical content maps to the same points
+        document_id = hashlib.sha256("\x00".join(chunk_texts).encode("utf-8")).hexdigest()
+    stored = bulk_upsert_chunks(collection_name, chunk_embeddings, chunk_texts, document_id, metadata=metadata)
+    print(f"Stored {stored} chunks in collection {collection_name}.")
 
 def retrieve_from_qdrant(collection_name, query_embedding, top_k=5):
-    search_results = client.search(
-        collection_name=collection_name,
-        query_vector=query_embedding,
-        limit=top_k,
-        with_payload=True
-    )
-    retrieved_Chunks = [
-        {"text": result.payload["text"], "score": result.score} for result in search_results
-    ]
+    return QdrantVectorStore().search(collection_name, query_embedding, top_k=top_k)
+
+class QdrantVectorStore(VectorStore):
+    """VectorStore backed by a Qdrant server (or any QdrantClient, e.g. ":memory:")."""
+
+    def __init__(self, qdrant_client=None, quantization=QDRANT_QUANTIZATION, oversample=None,
+                 batch_size=256, parallel=4, retries=3, backoff=0.5):
+        self._qdrant_client = qdrant_client
+        self.quantization = quantization
+        self.oversample = oversample or {"int8": 2.0, "binary": 3.0}.get(quantization, 2.0)
+        self.batch_size = batch_size
+        self.parallel = parallel
+        self.retries = retries
+        self.backoff = backoff
 
-    return retrieved_Chunks
+    @property
+    def client(self):
+        return self._qdrant_client or get_client()
 
+    def collection_exists(self, collection_name):
+        return self.client.collection_exists(collection_name)
 
+    def create_collection(self, collection_name, dim=1024):
+        if not self.client.collection_exists(collection_name):
+            self.client.create_collection(
+                collection_name=collection_name,
+                vectors_config=VectorParams(size=dim, distance=Distance.DOT, on_disk=True),
+                quantization_config=quantization_config(self.quantization)
+            )
+
+    def _upsert_with_retry(self, collection_name, points):
+        for attempt in range(self.retries + 1):
+            try:
+                self.client.upsert(collection_name=collection_name, points=points, wait=True)
+                return len(points)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                print(f"Upsert of {len(points)} points failed ({e}), retrying.")
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def _write(self, collection_name, ids, vectors, payloads):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+            # Only build the next batch once a slot frees up, so memory stays bounded
+            pending = deque()
+            for start in range(0, len(ids), self.batch_size):
+                points = [
+                    PointStruct(id=ids[i], vector=vectors[i].tolist(), payload=payloads[i])
+                    for i in range(start, min(start + self.batch_size, len(ids)))
+                ]
+                pending.append(pool.submit(self._upsert_with_retry, collection_name, points))
+                if len(pending) >= self.parallel:
+                    pending.popleft().result()
+            while pending:
+                pending.popleft().result()
+
+    def _remove(self, collection_name, ids):
+        self.client.delete(collection_name=collection_name, points_selector=PointIdsList(points=ids))
+
+    def _update_payloads(self, collection_name, ids, payloads):
+        self.client.batch_update_points(
+            collection_name=collection_name,
+            update_operations=[
+                SetPayloadOperation(set_payload=SetPayload(payload=payload, points=[point_id]))
+                for point_id, payload in zip(ids, payloads)
+            ],
+        )
+
+    def document_payloads(self, collection_name, document_id):
+        if not self.client.collection_exists(collection_name):
+            return
+        document_filter = Filter(must=[FieldCondition(key="document_id", match=MatchValue(value=document_id))])
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                scroll_filter=document_filter,
+                with_payload=True,
+                with_vectors=False,
+                limit=1024,
+                offset=offset,
+            )
+            for point in points:
+                yield point.id, point.payload
+            if offset is None:
+                return
+
+    def _search_params(self, exact):
+        if exact:
+            return SearchParams(exact=True, quantization=QuantizationSearchParams(ignore=True))
+        # Quantized collections search the codes and rescore the oversampled shortlist in float32
+        return SearchParams(quantization=QuantizationSearchParams(rescore=True, oversampling=self.oversample))
+
+    def search(self, collection_name, query_vector, top_k=5, exact=False):
+        search_results = self.client.search(
+            collection_name=collection_name,
+            query_vector=list(map(float, query_vector)),
+            limit=top_k,
+            with_payload=True,
+            search_params=self._search_params(exact)
+        )
+        return [{"id": result.id, **result.payload, "score": result.score} for result in search_results]
+
+    def search_batch(self, collection_name, query_vectors, top_k=5):
+        # One round trip for all queries
+        batch_results = self.client.search_batch(
+            collection_name=collection_name,
+            requests=[
+                SearchRequest(vector=list(map(float, query_vector)), limit=top_k, with_payload=True,
+                              params=self._search_params(False))
+                for query_vector in query_vectors
+            ]
+        )
+        return [
+            [{"id": result.id, **result.payload, "score": result.score} for result in search_results]
+            for search_results in batch_results
+        ]
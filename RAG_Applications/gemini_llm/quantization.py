@@ -0,0 +1,85 @@
+import numpy as np
+
+# Number of set bits for every byte value, used for Hamming distances on packed codes
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+BLOCK_ROWS = 65536
+
+def iter_blocks(vectors, block_rows=BLOCK_ROWS):
+    """Yields row blocks as views; segmented matrices are walked segment by segment."""
+    if hasattr(vectors, "blocks"):
+        for _, block in vectors.blocks(block_rows):
+            yield block
+    else:
+        for start in range(0, len(vectors), block_rows):
+            yield vectors[start:start + block_rows]
+
+class ScalarQuantizer:
+    """int8 codes with a per-dimension range: 4x smaller than float32."""
+
+    def fit(self, vectors):
+        lo = np.full(vectors.shape[1], np.inf, dtype=np.float32)
+        hi = np.full(vectors.shape[1], -np.inf, dtype=np.float32)
+        for block in iter_blocks(vectors):
+            block = np.asarray(block, dtype=np.float32)
+            lo = np.minimum(lo, block.min(axis=0))
+            hi = np.maximum(hi, block.max(axis=0))
+        self.offset = lo
+        self.scale = np.maximum(hi - lo, 1e-12) / 255.0
+        return self
+
+    def encode(self, vectors):
+        codes = np.empty(vectors.shape, dtype=np.int8)
+        start = 0
+        for block in iter_blocks(vectors):
+            block = np.asarray(block, dtype=np.float32)
+            levels = np.clip(np.rint((block - self.offset) / self.scale), 0, 255)
+            codes[start:start + len(block)] = (levels - 128).astype(np.int8)
+            start += len(block)
+        return codes
+
+    def scores(self, codes, query_vector):
+        # q . (offset + scale * (code + 128)), without decoding the whole matrix at once
+        weighted_query = (query_vector * self.scale).astype(np.float32)
+        bias = float(query_vector @ self.offset) + 128.0 * float(weighted_query.sum())
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), BLOCK_ROWS):
+            scores[start:start + BLOCK_ROWS] = codes[start:start + BLOCK_ROWS].astype(np.float32) @ weighted_query
+        return scores + bias
+
+class BinaryQuantizer:
+    """One sign bit per dimension: 32x smaller than float32."""
+
+    def fit(self, vectors):
+        self.dim = vectors.shape[1]
+        return self
+
+    def encode(self, vectors):
+        return np.concatenate([
+            np.packbits(np.asarray(block) > 0, axis=1) for block in iter_blocks(vectors)
+        ]) if len(vectors) else np.empty((0, (self.dim + 7) // 8), dtype=np.uint8)
+
+    def scores(self, codes, query_vector):
+        query_bits = np.packbits(query_vector > 0)
+        hamming = POPCOUNT[codes ^ query_bits].sum(axis=1, dtype=np.int32)
+        # Matching bits minus differing bits; higher is more similar
+        return (self.dim - 2 * hamming).astype(np.float32)
+
+QUANTIZERS = {"int8": ScalarQuantizer, "binary": BinaryQuantizer}
+
+def make_quantizer(kind):
+    if kind not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization: {kind}. Expected one of {sorted(QUANTIZERS)}.")
+    return QUANTIZERS[kind]()
+
+def recall_at_k(store, collection_name, query_vectors, top_k=5):
+    """Mean overlap between the store's normal search and an exact float32 search."""
+    recalls = []
+    for query_vector in query_vectors:
+        approx = {hit["id"] for hit in store.search(collection_name, query_vector, top_k=top_k)}
+        exact = {hit["id"] for hit in store.search(collection_name, query_vector, top_k=top_k, exact=True)}
+        if exact:
+            recalls.append(len(approx & exact) / len(exact))
+    recall = float(np.mean(recalls)) if recalls else 1.0
+    print(f"recall@{top_k} for {collection_name}: {recall:.4f} over {len(recalls)} queries")
+    return recall
@@ -0,0 +1,66 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+class QueryQueueFull(Exception):
+    """Raised when the embedding queue is full and the caller should back off."""
+
+class QueryEmbeddingService:
+    """
+    Collects queries that arrive within `max_wait_ms` of each other and embeds
+    them in one forward pass. Each caller blocks on its own future and gets its
+    own vector back.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=32, max_wait_ms=5, max_queue_size=256):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_size = max_queue_size
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Threads don't survive fork, so each worker process starts its own batcher on first use
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self.max_queue_size)
+                    threading.Thread(target=self._run, args=(self._queue,), name="query-embedder", daemon=True).start()
+                    self._pid = os.getpid()
+
+    def embed(self, query, enqueue_timeout=0.05, timeout=30):
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put((query, future), timeout=enqueue_timeout)
+        except queue.Full:
+            raise QueryQueueFull("Query embedding queue is full, try again later.")
+        return future.result(timeout=timeout)
+
+    def _next_batch(self, requests):
+        batch = [requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, requests):
+        while True:
+            batch = self._next_batch(requests)
+            futures = [future for _, future in batch]
+            try:
+                embeddings = self.encode_fn([query for query, _ in batch])
+                for future, embedding in zip(futures, embeddings):
+                    future.set_result(embedding.tolist())
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from resources import resources
+
+RERANKER_MODEL = os.environ.get("RERANKER_MODEL", "BAAI/bge-reranker-base")
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "20"))
+RERANK_TOP_N = int(os.environ.get("RERANK_TOP_N", "3"))
+# bge-reranker-base on a few CPU cores takes roughly 40-60 ms per 512-token pair, so the
+# default 20 candidates need about a second; lower RERANK_CANDIDATES for tighter budgets
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", "1500"))
+# Timed batches needed before the per-pair estimate may skip a request
+RERANK_MIN_SAMPLES = 3
+# After this many skips in a row the next request is scored anyway to refresh the estimate
+RERANK_REPROBE_AFTER = 20
+
+def _load_reranker():
+    cache_dir = os.environ.get("HF_CACHE_DIR") or None
+    model = AutoModelForSequenceClassification.from_pretrained(RERANKER_MODEL, cache_dir=cache_dir).eval()
+    tokenizer = AutoTokenizer.from_pretrained(RERANKER_MODEL, cache_dir=cache_dir)
+    # The first forward pass is several times slower than later ones; keep it out of request timings
+    with torch.inference_mode():
+        model(**tokenizer(["warm-up"], ["warm-up"], return_tensors="pt"))
+    return model, tokenizer
+
+# Optional: only loaded when a query asks for reranking
+resources.register("reranker", _load_reranker, required=False)
+
+class CrossEncoderReranker:
+    """
+    Re-scores (query, chunk) pairs with a local cross-encoder and keeps the best
+    `top_n`. Pair scores are cached (LRU). If the uncached pairs are expected to
+    take longer than the latency budget, or scoring runs past it, the original
+    retrieval order is kept instead. The expectation comes from a running
+    per-pair estimate that is only used after a few timed batches and is
+    re-measured after a run of skips, so one slow batch can't disable
+    reranking for good.
+    """
+
+    def __init__(self, batch_size=16, max_length=512, cache_size=50_000):
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self.skipped = 0
+        # Running estimate of seconds per pair, used to skip work that can't fit the budget
+        self._seconds_per_pair = None
+        self._samples = 0
+        self._skips_in_row = 0
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _pair_key(query, text):
+        return hashlib.sha256(f"{query}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _score_batch(self, query, texts):
+        model, tokenizer = resources.get("reranker")
+        inputs = tokenizer([query] * len(texts), texts, padding=True, truncation=True,
+                           max_length=self.max_length, return_tensors="pt")
+        with torch.inference_mode():
+            return model(**inputs).logits.view(-1).float().tolist()
+
+    def _record(self, seconds_per_pair):
+        with self._lock:
+            self._samples += 1
+            self._skips_in_row = 0
+            if self._seconds_per_pair is None:
+                self._seconds_per_pair = seconds_per_pair
+            else:
+                self._seconds_per_pair = 0.8 * self._seconds_per_pair + 0.2 * seconds_per_pair
+
+    def _should_skip(self, n_pairs, budget):
+        with self._lock:
+            if self._samples < RERANK_MIN_SAMPLES or self._seconds_per_pair * n_pairs <= budget:
+                return False
+            if self._skips_in_row >= RERANK_REPROBE_AFTER:
+                # Probe: the load may have dropped since the estimate was last updated
+                self._skips_in_row = 0
+                return False
+            self._skips_in_row += 1
+            self.skipped += 1
+            return True
+
+    def _remember(self, scores):
+        with self._lock:
+            for key, score in scores.items():
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    def rerank(self, query, chunks, top_n=RERANK_TOP_N, budget_ms=RERANK_BUDGET_MS):
+        keys = [self._pair_key(query, chunk["text"]) for chunk in chunks]
+        with self._lock:
+            scores = {key: self._scores[key] for key in keys if key in self._scores}
+        missing = [i for i, key in enumerate(keys) if key not in scores]
+
+        budget = budget_ms / 1000.0
+        if missing and self._should_skip(len(missing), budget):
+            return chunks[:top_n]
+
+        # Loading the model is not part of the per-pair time
+        if missing:
+            resources.get("reranker")
+        start = time.perf_counter()
+        for batch_start in range(0, len(missing), self.batch_size):
+            batch = missing[batch_start:batch_start + self.batch_size]
+            batch_time = time.perf_counter()
+            for i, score in zip(batch, self._score_batch(query, [chunks[i]["text"] for i in batch])):
+                scores[keys[i]] = score
+            self._record((time.perf_counter() - batch_time) / len(batch))
+            if time.perf_counter() - start > budget and batch_start + self.batch_size < len(missing):
+                with self._lock:
+                    self.skipped += 1
+                # Pairs scored so far are still reused by later queries
+                self._remember(scores)
+                return chunks[:top_n]
+
+        self._remember({key: scores[key] for key in keys})
+
+        ranked = sorted(range(len(chunks)), key=lambda i: scores[keys[i]], reverse=True)[:top_n]
+        return [{**chunks[i], "retrieval_score": chunks[i]["score"], "score": scores[keys[i]]} for i in ranked]
+
+reranker = CrossEncoderReranker()
@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+
+class ResourceManager:
+    """
+    Process-wide registry of expensive resources (models, clients). Each one is
+    built by its loader on first use, or up front by warm_up(). Resources
+    registered with fork_safe=False (network clients, threads) are rebuilt in a
+    forked worker; fork-safe ones (model weights) are shared copy-on-write.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._instances = {}
+        self._locks = {}
+        self._load_seconds = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._background = None
+
+    def register(self, name, loader, fork_safe=True, required=True):
+        with self._lock:
+            self._loaders[name] = (loader, fork_safe, required)
+            self._locks[name] = threading.Lock()
+
+    def _loaded(self, name):
+        instance = self._instances.get(name)
+        if instance is None:
+            return False
+        _, fork_safe, _ = self._loaders[name]
+        # A client built by the parent process is not safe to use after fork
+        return fork_safe or instance[0] == os.getpid()
+
+    def get(self, name):
+        if not self._loaded(name):
+            with self._locks[name]:
+                if not self._loaded(name):
+                    loader = self._loaders[name][0]
+                    start = time.perf_counter()
+                    try:
+                        self._instances[name] = (os.getpid(), loader())
+                    except Exception as e:
+                        self._errors[name] = str(e)
+                        raise
+                    self._errors.pop(name, None)
+                    self._load_seconds[name] = time.perf_counter() - start
+                    print(f"Loaded {name} in {self._load_seconds[name]:.2f}s")
+        return self._instances[name][1]
+
+    def warm_up(self, names=None):
+        """Loads the given resources (default: all required ones) now instead of on first request."""
+        for name in names or [name for name, (_, _, required) in self._loaders.items() if required]:
+            self.get(name)
+        return self.status()
+
+    def warm_up_in_background(self, retry_seconds=30.0):
+        """
+        Loads the required resources on a daemon thread, retrying failures every
+        `retry_seconds`, so ready() turns true without waiting for a request.
+        A forked worker starts its own thread for the resources it must rebuild.
+        """
+        def run():
+            while True:
+                try:
+                    self.warm_up()
+                    return
+                except Exception as e:
+                    print(f"Warm-up failed, retrying in {retry_seconds:.0f}s: {e}")
+                    time.sleep(retry_seconds)
+
+        def start_in_child():
+            # A lock held by the parent's warm-up thread would stay locked in the child forever
+            self._lock = threading.Lock()
+            self._locks = {name: threading.Lock() for name in self._loaders}
+            start()
+
+        def start():
+            self._background = threading.Thread(target=run, name="resource-warm-up", daemon=True)
+            self._background.start()
+
+        if self._background is None:
+            os.register_at_fork(after_in_child=start_in_child)
+            start()
+
+    def status(self):
+        return {
+            name: {
+                "loaded": self._loaded(name),
+                "required": required,
+                "load_seconds": self._load_seconds.get(name),
+                "error": self._errors.get(name),
+            }
+            for name, (_, _, required) in self._loaders.items()
+        }
+
+    def ready(self):
+        return all(self._loaded(name) for name, (_, _, required) in self._loaders.items() if required)
+
+resources = ResourceManager()
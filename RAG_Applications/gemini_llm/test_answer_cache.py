@@ -0,0 +1,52 @@
+import time
+import numpy as np
+from answer_cache import SemanticAnswerCache, answer_cache
+from vector_store import LocalVectorStore
+
+def _unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def test_reuses_answers_only_for_similar_queries_over_the_same_chunks():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store("docs", _unit(1, 0), ["a", "b"], "answer")
+    # Close enough (cos ~ 0.995), and chunk order doesn't matter
+    assert cache.lookup("docs", _unit(1, 0.1), ["b", "a"]) == "answer"
+    # cos ~ 0.89 is below the threshold
+    assert cache.lookup("docs", _unit(1, 0.5), ["a", "b"]) is None
+    # Different retrieved chunks or collection
+    assert cache.lookup("docs", _unit(1, 0), ["a"]) is None
+    assert cache.lookup("other", _unit(1, 0), ["a", "b"]) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    cache = SemanticAnswerCache(ttl_seconds=60)
+    cache.store("docs", _unit(1, 0), ["a"], "answer")
+    now[0] += 59
+    assert cache.lookup("docs", _unit(1, 0), ["a"]) == "answer"
+    now[0] += 2
+    assert cache.lookup("docs", _unit(1, 0), ["a"]) is None
+    assert cache.stats()["entries"] == 0
+
+def test_least_recently_used_entries_are_evicted():
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.store("docs", _unit(1, 0), ["a"], "first")
+    cache.store("docs", _unit(1, 0), ["b"], "second")
+    cache.lookup("docs", _unit(1, 0), ["a"])
+    cache.store("docs", _unit(1, 0), ["c"], "third")
+    assert cache.lookup("docs", _unit(1, 0), ["b"]) is None
+    assert cache.lookup("docs", _unit(1, 0), ["a"]) == "first"
+
+def test_writes_to_a_collection_invalidate_only_its_answers(tmp_path, monkeypatch):
+    # BM25 indexes live under .rag/ in the working directory
+    monkeypatch.chdir(tmp_path)
+    store = LocalVectorStore(root=str(tmp_path / "vectors"))
+    store.create_collection("docs", dim=2)
+    answer_cache.store("docs", _unit(1, 0), ["a"], "stale")
+    answer_cache.store("notes", _unit(1, 0), ["a"], "kept")
+    store.upsert("docs", ["a"], [_unit(1, 0)], [{"text": "re-ingested"}])
+    assert answer_cache.lookup("docs", _unit(1, 0), ["a"]) is None
+    assert answer_cache.lookup("notes", _unit(1, 0), ["a"]) == "kept"
+    answer_cache.invalidate("notes")
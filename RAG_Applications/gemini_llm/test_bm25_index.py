@@ -0,0 +1,19 @@
+import pytest
+from bm25_index import BM25Index
+from collection_names import InvalidCollectionName
+
+def test_search_on_unknown_collection_creates_nothing(tmp_path):
+    index = BM25Index("never_ingested", root=str(tmp_path / "bm25"))
+    assert index.search("aspirin") == []
+    assert not (tmp_path / "bm25").exists()
+
+@pytest.mark.parametrize("name", ["../../x", "a/b", "..", ".hidden", ""])
+def test_collection_names_cannot_leave_the_index_directory(tmp_path, name):
+    with pytest.raises(InvalidCollectionName):
+        BM25Index(name, root=str(tmp_path))
+
+def test_codes_are_indexed_whole_and_by_part(tmp_path):
+    index = BM25Index("docs", root=str(tmp_path))
+    index.add(["a", "b"], [{"text": "Take AB-1234 twice daily"}, {"text": "Store below 25C"}])
+    assert [hit["id"] for hit in index.search("ab-1234")] == ["a"]
+    assert [hit["id"] for hit in index.search("1234")] == ["a"]
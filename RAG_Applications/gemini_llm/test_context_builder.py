@@ -0,0 +1,24 @@
+from context_builder import assemble_context, merge_chunks
+
+def test_chunks_from_different_pages_are_not_spliced():
+    # Spans are offsets within each page, so these overlap numerically but not in the document
+    page_3 = {"id": 1, "document_id": "leaflet.pdf", "page_number": 3, "start": 0, "end": 37,
+              "text": "Adults: take aspirin 100mg daily.", "score": 0.9}
+    page_7 = {"id": 2, "document_id": "leaflet.pdf", "page_number": 7, "start": 20, "end": 64,
+              "text": "Do not exceed 4g of paracetamol.", "score": 0.8}
+    merged = merge_chunks([page_3, page_7])
+    assert sorted(chunk["text"] for chunk in merged) == sorted([page_3["text"], page_7["text"]])
+
+def test_overlapping_chunks_of_one_page_are_merged():
+    first = {"id": 1, "document_id": "leaflet.pdf", "page_number": 2, "start": 0, "end": 20,
+             "text": "Take one tablet with", "score": 0.5}
+    second = {"id": 2, "document_id": "leaflet.pdf", "page_number": 2, "start": 9, "end": 36,
+              "text": "tablet with water at night.", "score": 0.7}
+    (merged,) = merge_chunks([second, first])
+    assert merged["text"] == "Take one tablet with water at night."
+    assert merged["score"] == 0.7
+
+def test_duplicates_are_dropped_and_budget_respected():
+    chunks = [{"id": i, "text": f"chunk {i} " * 20, "score": 1.0 - i / 10} for i in range(5)]
+    packed = assemble_context(chunks + chunks[:2], token_budget=100)
+    assert len(packed) == len(set(packed)) == 2
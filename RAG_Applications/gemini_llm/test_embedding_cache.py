@@ -0,0 +1,52 @@
+import multiprocessing
+import numpy as np
+from embedding_cache import EmbeddingCache
+
+def _fill(cache_dir, worker, count):
+    cache = EmbeddingCache("model", {}, dim=4, max_entries=64, cache_dir=cache_dir)
+    for i in range(count):
+        cache.put_many([f"worker {worker} chunk {i}"], np.full((1, 4), worker * 1000 + i, dtype=np.float32))
+
+def test_workers_sharing_a_cache_never_reuse_a_slot(tmp_path):
+    # Each pre-forked worker opens its own EmbeddingCache on the same directory
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=_fill, args=(str(tmp_path), worker, 20)) for worker in range(3)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+    assert [process.exitcode for process in workers] == [0, 0, 0]
+
+    cache = EmbeddingCache("model", {}, dim=4, max_entries=64, cache_dir=str(tmp_path))
+    texts = [f"worker {worker} chunk {i}" for worker in range(3) for i in range(20)]
+    embeddings, found = cache.get_many(texts)
+    assert found.all()
+    expected = [worker * 1000 + i for worker in range(3) for i in range(20)]
+    assert embeddings[:, 0].tolist() == expected
+
+def _churn(cache_dir, count):
+    cache = EmbeddingCache("model", {}, dim=4, max_entries=8, cache_dir=cache_dir)
+    for i in range(count):
+        cache.put_many([f"chunk {i}"], np.full((1, 4), i, dtype=np.float32))
+
+def test_reads_never_return_a_vector_recycled_by_another_worker(tmp_path):
+    # A tiny cache that another process keeps filling, so slots are recycled all the time
+    writer = multiprocessing.get_context("spawn").Process(target=_churn, args=(str(tmp_path), 3000))
+    writer.start()
+    cache = EmbeddingCache("model", {}, dim=4, max_entries=8, cache_dir=str(tmp_path))
+    texts = [f"chunk {i}" for i in range(3000)]
+    while writer.is_alive():
+        embeddings, found = cache.get_many(texts[::7])
+        expected = np.arange(0, 3000, 7, dtype=np.float32)
+        assert (embeddings[found, 0] == expected[found]).all()
+    writer.join()
+    assert writer.exitcode == 0
+
+def test_least_recently_used_rows_are_recycled(tmp_path):
+    cache = EmbeddingCache("model", {}, dim=2, max_entries=2, cache_dir=str(tmp_path))
+    cache.put_many(["a", "b"], np.array([[1, 1], [2, 2]], dtype=np.float32))
+    cache.get_many(["a"])
+    cache.put_many(["c"], np.array([[3, 3]], dtype=np.float32))
+    embeddings, found = cache.get_many(["a", "b", "c"])
+    assert found.tolist() == [True, False, True]
+    assert embeddings[2].tolist() == [3, 3]
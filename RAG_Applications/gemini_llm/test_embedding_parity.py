@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+huggingface_hub = pytest.importorskip("huggingface_hub")
+
+import openai_clip
+from embedding_parity import SAMPLE_TEXTS, check_backend_parity
+
+@pytest.fixture(scope="module", autouse=True)
+def cached_model():
+    # Parity needs the real weights; never download them from a test run
+    if not isinstance(huggingface_hub.try_to_load_from_cache(openai_clip.MODEL_NAME, "config.json",
+                                                             cache_dir=openai_clip.HF_CACHE_DIR), str):
+        pytest.skip(f"{openai_clip.MODEL_NAME} is not in the Hugging Face cache")
+
+@pytest.mark.parametrize("backend", ["torch", "torch-int8", "onnx-int8"])
+def test_backend_embeddings_match_fp32(backend, monkeypatch):
+    if backend == "onnx-int8":
+        pytest.importorskip("optimum.onnxruntime")
+    model, device = openai_clip.load_embedding_model(backend)
+    # embed_queries goes through the shared resource; point it at this backend's model instead
+    monkeypatch.setattr(openai_clip, "EMBEDDING_BACKEND", backend)
+    monkeypatch.setattr(openai_clip, "get_model", lambda: model)
+    monkeypatch.setattr(openai_clip, "get_device", lambda: device)
+    cosines = check_backend_parity(min_cosine=0.99)
+    assert cosines.shape == (len(SAMPLE_TEXTS),)
@@ -0,0 +1,44 @@
+import hashlib
+import numpy as np
+import pytest
+
+pytest.importorskip("qdrant_client")
+from bm25_index import BM25Index
+from incremental_index import index_document
+from qdrant import chunk_keys, chunk_point_id
+from vector_store import LocalVectorStore
+
+def _embed(texts, embedded):
+    embedded.extend(texts)
+    vectors = [np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest()[:16], dtype=np.uint8).astype(np.float32)
+               for text in texts]
+    return np.stack([vector / np.linalg.norm(vector) for vector in vectors])
+
+def test_reindexing_only_touches_changed_chunks(tmp_path, monkeypatch):
+    # Manifests and BM25 indexes live under .rag/ in the working directory
+    monkeypatch.chdir(tmp_path)
+    store = LocalVectorStore(root=str(tmp_path / "vectors"))
+    store.create_collection("docs", dim=16)
+    embedded = []
+    v1 = ["aspirin dosage", "ibuprofen warnings", "storage conditions", "pediatric use"]
+    index_document("docs", "manual.pdf", v1, lambda texts: _embed(texts, embedded), vector_store=store)
+    assert embedded == v1
+
+    # Edit one chunk, drop one, and move the rest around
+    embedded.clear()
+    v2 = ["pediatric use", "aspirin dosage", "ibuprofen warnings revised"]
+    stats = index_document("docs", "manual.pdf", v2, lambda texts: _embed(texts, embedded), vector_store=store)
+    assert stats == {"added": 1, "removed": 2, "moved": 2, "unchanged": 2}
+    assert embedded == ["ibuprofen warnings revised"]
+
+    points = dict(store.document_payloads("docs", "manual.pdf"))
+    assert set(points) == {chunk_point_id("manual.pdf", key) for key in chunk_keys(v2)}
+    assert {payload["text"]: payload["chunk_index"] for payload in points.values()} == {
+        "pediatric use": 0, "aspirin dosage": 1, "ibuprofen warnings revised": 2,
+    }
+    assert BM25Index("docs").search("storage") == []
+
+    # Same text again: nothing to embed or write
+    embedded.clear()
+    stats = index_document("docs", "manual.pdf", v2, lambda texts: _embed(texts, embedded), vector_store=store)
+    assert embedded == [] and stats["added"] == stats["removed"] == stats["moved"] == 0
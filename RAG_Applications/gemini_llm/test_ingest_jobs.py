@@ -0,0 +1,118 @@
+import threading
+import time
+from ingest_jobs import IngestJobQueue
+
+FINAL = ("done", "failed", "cancelled")
+
+def _upload(tmp_path, content, name="manual.pdf"):
+    path = tmp_path / f"{time.monotonic_ns()}_{name}"
+    path.write_bytes(content)
+    return str(path)
+
+def _wait(queue, job_id, statuses=FINAL, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} still {queue.get(job_id)['status']}")
+
+def _queue(tmp_path, run_fn=lambda job, report: None, **kwargs):
+    return IngestJobQueue(run_fn, workers=1, db_path=str(tmp_path / "jobs.sqlite"), poll_interval=0.02, **kwargs)
+
+def test_only_the_latest_version_of_a_document_counts_as_duplicate(tmp_path):
+    queue = _queue(tmp_path)
+    v1, created = queue.submit(_upload(tmp_path, b"v1"), "manual.pdf", "u", "docs")
+    assert created and v1["document_id"] == "manual.pdf"
+    _wait(queue, v1["id"])
+    job, created = queue.submit(_upload(tmp_path, b"v1"), "manual.pdf", "u", "docs")
+    assert not created and job["id"] == v1["id"]
+
+    v2, created = queue.submit(_upload(tmp_path, b"v2"), "manual.pdf", "u", "docs")
+    assert created
+    _wait(queue, v2["id"])
+    # Rolling back to v1 is a new version, not a duplicate of the old v1 job
+    rollback, created = queue.submit(_upload(tmp_path, b"v1"), "manual.pdf", "u", "docs")
+    assert created and rollback["id"] != v1["id"]
+
+    # The same bytes under another document are their own document
+    _, created = queue.submit(_upload(tmp_path, b"v1"), "copy.pdf", "u", "docs")
+    assert created
+
+def test_identical_concurrent_uploads_create_one_job(tmp_path):
+    release = threading.Event()
+    queue = _queue(tmp_path, lambda job, report: release.wait(5))
+    paths = [_upload(tmp_path, b"same bytes") for _ in range(8)]
+    results = []
+    threads = [threading.Thread(target=lambda p=p: results.append(queue.submit(p, "a.pdf", "u", "docs"))) for p in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    release.set()
+    assert sum(created for _, created in results) == 1
+    assert len({job["id"] for job, _ in results}) == 1
+
+def test_finished_jobs_remove_their_upload(tmp_path):
+    queue = _queue(tmp_path, lambda job, report: 1 / 0 if job["document_id"] == "bad.pdf" else None)
+    good = _upload(tmp_path, b"good")
+    bad = _upload(tmp_path, b"bad")
+    done = _wait(queue, queue.submit(good, "good.pdf", "u", "docs")[0]["id"])
+    failed = _wait(queue, queue.submit(bad, "bad.pdf", "u", "docs")[0]["id"])
+    assert (done["status"], failed["status"]) == ("done", "failed")
+    assert "division by zero" in failed["error"]
+    assert not (tmp_path / good).exists() and not (tmp_path / bad).exists()
+
+def test_cancel_queued_and_running_jobs(tmp_path):
+    started = threading.Event()
+
+    def run(job, report):
+        started.set()
+        while True:
+            report(0.1, "parsing")
+            time.sleep(0.01)
+
+    queue = _queue(tmp_path, run)
+    running = queue.submit(_upload(tmp_path, b"a"), "a.pdf", "u", "docs")[0]
+    assert started.wait(5)
+    queued_path = _upload(tmp_path, b"b")
+    queued = queue.submit(queued_path, "b.pdf", "u", "docs")[0]
+
+    assert queue.cancel(queued["id"])["status"] == "cancelled"
+    assert not (tmp_path / queued_path).exists()
+    assert queue.cancel(running["id"])["cancel_requested"] == 1
+    assert _wait(queue, running["id"])["status"] == "cancelled"
+
+def test_versions_of_one_document_run_one_at_a_time(tmp_path):
+    active, overlaps = [], []
+
+    def run(job, report):
+        active.append(job["id"])
+        overlaps.append(len(active))
+        time.sleep(0.05)
+        active.remove(job["id"])
+
+    queue = IngestJobQueue(run, workers=3, db_path=str(tmp_path / "jobs.sqlite"), poll_interval=0.02)
+    jobs = [queue.submit(_upload(tmp_path, bytes([i])), "manual.pdf", "u", "docs")[0] for i in range(3)]
+    for job in jobs:
+        _wait(queue, job["id"])
+    assert max(overlaps) == 1
+
+def test_restart_only_requeues_jobs_with_an_expired_lease(tmp_path):
+    dormant = _queue(tmp_path, start=False)
+    now = time.time()
+    with dormant._connect() as db:
+        for job_id, updated_at in (("orphaned", now - 3600), ("alive", now)):
+            db.execute(
+                "INSERT INTO jobs (id, file_path, file_name, user_id, collection, document_id, status, progress, "
+                "created_at, updated_at, owner) VALUES (?, ?, 'x.pdf', 'u', 'docs', ?, 'running', 0.5, ?, ?, 'other:1')",
+                (job_id, _upload(tmp_path, job_id.encode()), job_id, updated_at, updated_at),
+            )
+
+    ran = []
+    _queue(tmp_path, lambda job, report: ran.append(job["id"]))
+    assert _wait(_queue(tmp_path, start=False), "orphaned")["status"] == "done"
+    assert ran == ["orphaned"]
+    alive = dormant.get("alive")
+    assert (alive["status"], alive["owner"]) == ("running", "other:1")
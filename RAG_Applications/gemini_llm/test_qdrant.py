@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("qdrant_client")
+from qdrant_client import QdrantClient
+from qdrant import QdrantVectorStore, bulk_upsert_chunks, chunk_keys, chunk_point_id
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # BM25 indexes live under .rag/ in the working directory
+    monkeypatch.chdir(tmp_path)
+    client = QdrantClient(":memory:")
+    QdrantVectorStore(client).create_collection("docs", dim=4)
+    return client
+
+def test_reingesting_a_document_overwrites_its_points(client):
+    # The repeated chunk must still get its own point
+    texts = ["aspirin dosage", "storage conditions", "aspirin dosage", "pediatric use", "warnings"]
+    embeddings = np.eye(5, 4, dtype=np.float32) + 0.1
+    for _ in range(2):
+        stored = bulk_upsert_chunks("docs", embeddings, texts, "manual.pdf", qdrant_client=client, batch_size=2, parallel=2)
+        assert stored == len(texts)
+
+    points, _ = client.scroll("docs", limit=100, with_payload=True)
+    assert len(points) == len(texts)
+    assert {point.id for point in points} == {chunk_point_id("manual.pdf", key) for key in chunk_keys(texts)}
+    assert sorted(point.payload["chunk_index"] for point in points) == list(range(len(texts)))
+
+    # Another document with the same text gets its own points
+    bulk_upsert_chunks("docs", embeddings[:1], texts[:1], "copy.pdf", qdrant_client=client)
+    assert client.count("docs").count == len(texts) + 1
+
+def test_store_search_and_delete(client):
+    store = QdrantVectorStore(client)
+    store.upsert("docs", [chunk_point_id("d", "a"), chunk_point_id("d", "b")],
+                 [[1, 0, 0, 0], [0, 1, 0, 0]], [{"text": "a", "document_id": "d"}, {"text": "b", "document_id": "d"}])
+    assert store.search("docs", [0, 1, 0, 0], top_k=1)[0]["text"] == "b"
+    store.delete("docs", [chunk_point_id("d", "b")])
+    assert [payload["text"] for _, payload in store.document_payloads("docs", "d")] == ["a"]
@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+import reranker as reranker_module
+from reranker import RERANK_MIN_SAMPLES, RERANK_REPROBE_AFTER, CrossEncoderReranker
+
+def _chunks(n):
+    return [{"id": i, "text": f"chunk {i}", "score": 1.0 - i / n} for i in range(n)]
+
+@pytest.fixture
+def scorer(monkeypatch):
+    # No model download: loading is a no-op and each pair costs a fixed, fake amount of time
+    clock = {"now": 0.0, "per_pair": 0.001}
+    monkeypatch.setattr(reranker_module.resources, "get", lambda name: None)
+    monkeypatch.setattr(reranker_module.time, "perf_counter", lambda: clock["now"])
+
+    def score_batch(self, query, texts):
+        clock["now"] += clock["per_pair"] * len(texts)
+        return [float(len(text)) for text in texts]
+
+    monkeypatch.setattr(CrossEncoderReranker, "_score_batch", score_batch)
+    return clock
+
+def test_one_slow_batch_does_not_disable_reranking(scorer):
+    model = CrossEncoderReranker(batch_size=4)
+    scorer["per_pair"] = 10.0
+    model.rerank("first", _chunks(4), budget_ms=100)
+    scorer["per_pair"] = 0.001
+    result = model.rerank("second", _chunks(4), budget_ms=100)
+    assert "retrieval_score" in result[0]
+    assert model.skipped == 0
+
+def test_skipping_reprobes_and_recovers(scorer):
+    model = CrossEncoderReranker(batch_size=4)
+    scorer["per_pair"] = 1.0
+    for i in range(RERANK_MIN_SAMPLES):
+        model.rerank(f"slow {i}", _chunks(4), budget_ms=10_000)
+    for i in range(RERANK_REPROBE_AFTER):
+        assert "retrieval_score" not in model.rerank(f"skipped {i}", _chunks(4), budget_ms=100)[0]
+
+    scorer["per_pair"] = 0.001
+    assert "retrieval_score" in model.rerank("probe", _chunks(4), budget_ms=100)[0]
+    assert model.skipped == RERANK_REPROBE_AFTER
@@ -0,0 +1,31 @@
+import threading
+from resources import ResourceManager
+
+def test_background_warm_up_makes_lazy_mode_ready_without_a_request():
+    manager = ResourceManager()
+    release = threading.Event()
+    manager.register("model", lambda: release.wait(5) and "weights")
+    manager.register("optional", lambda: 1 / 0, required=False)
+
+    manager.warm_up_in_background(retry_seconds=0.01)
+    assert not manager.ready()
+    release.set()
+    manager._background.join(5)
+    assert manager.ready()
+    assert not manager.status()["optional"]["loaded"]
+
+def test_background_warm_up_retries_failed_loads():
+    manager = ResourceManager()
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("not up yet")
+        return "client"
+
+    manager.register("client", flaky)
+    manager.warm_up_in_background(retry_seconds=0.01)
+    manager._background.join(5)
+    assert manager.ready()
+    assert len(attempts) == 3
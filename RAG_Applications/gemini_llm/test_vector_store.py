@@ -0,0 +1,180 @@
+import multiprocessing
+import numpy as np
+import pytest
+from bm25_index import BM25Index
+from vector_store import LocalVectorStore
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # BM25 indexes live under .rag/ in the working directory
+    monkeypatch.chdir(tmp_path)
+    store = LocalVectorStore(root=str(tmp_path / "vectors"))
+    store.create_collection("docs", dim=4)
+    return store
+
+def _unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def test_upsert_keeps_bm25_in_sync(store):
+    store.upsert("docs", ["a", "b"], [_unit(1, 0, 0, 0), _unit(0, 1, 0, 0)],
+                 [{"text": "aspirin 100mg daily"}, {"text": "paracetamol dose"}])
+    assert [hit["id"] for hit in store.search("docs", _unit(1, 0, 0, 0), top_k=1)] == ["a"]
+    assert [hit["id"] for hit in BM25Index("docs").search("paracetamol")] == ["b"]
+
+    store.delete("docs", ["b"])
+    assert BM25Index("docs").search("paracetamol") == []
+    assert [hit["id"] for hit in store.search("docs", _unit(0, 1, 0, 0), top_k=5)] == ["a"]
+
+def test_writes_survive_reload(store, tmp_path):
+    for batch in range(3):
+        ids = [f"{batch}-{i}" for i in range(4)]
+        vectors = [_unit(batch + 1, i + 1, 0, 1) for i in range(4)]
+        store.upsert("docs", ids, vectors, [{"text": point_id, "document_id": f"doc-{batch}", "page_number": batch} for point_id in ids])
+    store.upsert("docs", ["0-0"], [_unit(0, 0, 1, 0)], [{"text": "replaced"}])
+    store.delete("docs", ["1-1"])
+    store.set_payload("docs", ["2-2"], [{"text": "2-2", "page_number": 7}])
+
+    reloaded = LocalVectorStore(root=str(tmp_path / "vectors"))
+    hits = reloaded.search("docs", _unit(0, 0, 1, 0), top_k=20)
+    assert len(hits) == 11
+    assert hits[0]["id"] == "0-0" and hits[0]["text"] == "replaced"
+    assert "1-1" not in {hit["id"] for hit in hits}
+    assert {hit["id"]: hit.get("page_number") for hit in hits}["2-2"] == 7
+    assert sorted(point_id for point_id, _ in reloaded.document_payloads("docs", "doc-1")) == ["1-0", "1-2", "1-3"]
+
+def test_compaction_drops_dead_rows(store, tmp_path):
+    store.upsert("docs", ["a", "b", "c"], [_unit(1, 0, 0, 0), _unit(0, 1, 0, 0), _unit(0, 0, 1, 0)],
+                 [{"text": "a"}, {"text": "b"}, {"text": "c"}])
+    store.delete("docs", ["b"])
+    store.compact("docs")
+    assert len(list((tmp_path / "vectors" / "docs" / "segments").iterdir())) == 1
+    reloaded = LocalVectorStore(root=str(tmp_path / "vectors"))
+    assert sorted(hit["id"] for hit in reloaded.search("docs", _unit(1, 1, 1, 0), top_k=5)) == ["a", "c"]
+    assert sorted(hit["id"] for hit in reloaded.search_batch("docs", [_unit(1, 1, 1, 0)], top_k=5)[0]) == ["a", "c"]
+
+def test_quantized_search_skips_deleted_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = LocalVectorStore(root=str(tmp_path / "vectors"), quantization="int8")
+    store.create_collection("docs", dim=4)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 4)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [str(i) for i in range(50)]
+    store.upsert("docs", ids, vectors, [{"text": point_id} for point_id in ids])
+    store.delete("docs", ["0"])
+    hits = store.search("docs", vectors[0], top_k=5)
+    assert len(hits) == 5 and "0" not in {hit["id"] for hit in hits}
+
+def test_single_file_collections_are_converted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "vectors" / "old"
+    path.mkdir(parents=True)
+    (path / "meta.json").write_text('{"dim": 4, "dtype": "float32"}')
+    np.save(path / "vectors.npy", np.stack([_unit(1, 0, 0, 0), _unit(0, 1, 0, 0)]))
+    (path / "points.jsonl").write_text('{"id": "a", "payload": {"text": "a"}}\n{"id": "b", "payload": {"text": "b"}}\n')
+    store = LocalVectorStore(root=str(tmp_path / "vectors"))
+    assert [hit["id"] for hit in store.search("old", _unit(0, 1, 0, 0), top_k=1)] == ["b"]
+    assert not (path / "vectors.npy").exists()
+
+def _random_unit(rng, n, dim=4):
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def test_segments_are_searched_in_place(store):
+    rng = np.random.default_rng(1)
+    vectors = _random_unit(rng, 60)
+    ids = [str(i) for i in range(60)]
+    for start in range(0, 60, 20):
+        store.upsert("docs", ids[start:start + 20], vectors[start:start + 20], [{"text": i} for i in ids[start:start + 20]])
+
+    matrix = store._get("docs").vectors
+    assert len(matrix.segments) == 3 and all(isinstance(segment, np.memmap) for segment in matrix.segments)
+    query = vectors[42]
+    expected = [str(i) for i in np.argsort(-(vectors @ query))[:5]]
+    assert [hit["id"] for hit in store.search("docs", query, top_k=5)] == expected
+    assert [hit["id"] for hit in store.search_batch("docs", [query], top_k=5)[0]] == expected
+
+def test_writes_extend_the_ivf_index_instead_of_retraining(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = LocalVectorStore(root=str(tmp_path / "vectors"), ivf_min_rows=100)
+    store.create_collection("docs", dim=4)
+    rng = np.random.default_rng(2)
+    vectors = _random_unit(rng, 150)
+    ids = [str(i) for i in range(150)]
+    store.upsert("docs", ids[:100], vectors[:100], [{"text": i} for i in ids[:100]])
+    store.search("docs", vectors[0], top_k=1)
+    index = store._get("docs").index
+    assert index is not None
+
+    store.upsert("docs", ids[100:], vectors[100:], [{"text": i} for i in ids[100:]])
+    store.delete("docs", ["0"])
+    assert store.search("docs", vectors[120], top_k=1)[0]["id"] == "120"
+    assert "0" not in {hit["id"] for hit in store.search("docs", vectors[0], top_k=10)}
+    assert store._get("docs").index is index
+
+    # Doubling the collection makes the index stale; the next search retrains it
+    store.upsert("docs", [f"x{i}" for i in range(60)], _random_unit(rng, 60), [{"text": "x"}] * 60)
+    store.search("docs", vectors[1], top_k=1)
+    assert store._get("docs").index is not index
+
+def _write_batches(root, worker, batches):
+    store = LocalVectorStore(root=root)
+    rng = np.random.default_rng(worker)
+    for batch in range(batches):
+        ids = [f"{worker}-{batch}-{i}" for i in range(5)]
+        store.upsert("docs", ids, _random_unit(rng, 5), [{"text": point_id} for point_id in ids])
+        if batch % 10 == 9:
+            store.compact("docs")
+
+def test_processes_sharing_a_collection_see_each_others_writes(store, tmp_path):
+    root = str(tmp_path / "vectors")
+    other = LocalVectorStore(root=root)
+    store.upsert("docs", ["a", "b"], [_unit(1, 0, 0, 0), _unit(0, 1, 0, 0)], [{"text": "a"}, {"text": "b"}])
+    assert [hit["id"] for hit in other.search("docs", _unit(0, 1, 0, 0), top_k=1)] == ["b"]
+
+    # A compaction by the other store replaces the log and removes the segments this one has loaded
+    other.delete("docs", ["a"])
+    other.upsert("docs", ["c"], [_unit(0, 0, 1, 0)], [{"text": "c"}])
+    other.compact("docs")
+    assert sorted(hit["id"] for hit in store.search("docs", _unit(1, 1, 1, 0), top_k=5)) == ["b", "c"]
+    store.upsert("docs", ["d"], [_unit(0, 0, 0, 1)], [{"text": "d"}])
+    assert sorted(hit["id"] for hit in other.search("docs", _unit(1, 1, 1, 1), top_k=5)) == ["b", "c", "d"]
+
+def test_concurrent_writers_and_compactions_lose_nothing(store, tmp_path):
+    root = str(tmp_path / "vectors")
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=_write_batches, args=(root, worker, 30)) for worker in range(3)]
+    for process in workers:
+        process.start()
+    # Searching meanwhile keeps tailing the log and reloading after the compactions
+    while any(process.is_alive() for process in workers):
+        store.search("docs", _unit(1, 0, 0, 0), top_k=5)
+    for process in workers:
+        process.join()
+    assert [process.exitcode for process in workers] == [0, 0, 0]
+    hits = store.search("docs", _unit(1, 0, 0, 0), top_k=1000)
+    assert len(hits) == 3 * 30 * 5
+
+def test_writes_encode_only_the_new_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = LocalVectorStore(root=str(tmp_path / "vectors"), quantization="int8")
+    store.create_collection("docs", dim=4)
+    rng = np.random.default_rng(3)
+    vectors = _random_unit(rng, 80)
+    ids = [str(i) for i in range(80)]
+    store.upsert("docs", ids[:50], vectors[:50], [{"text": i} for i in ids[:50]])
+    store.search("docs", vectors[0], top_k=1)
+    collection = store._get("docs")
+    quantizer, codes = collection.quantizer, collection.codes.copy()
+
+    store.upsert("docs", ids[50:], vectors[50:], [{"text": i} for i in ids[50:]])
+    store.delete("docs", ["1"])
+    assert store.search("docs", vectors[60], top_k=1)[0]["id"] == "60"
+    assert collection.quantizer is quantizer
+    assert np.array_equal(collection.codes[:50], codes)
+    assert np.array_equal(collection.codes[50:], quantizer.encode(vectors[50:]))
+
+    store.compact("docs")
+    assert collection.quantizer is quantizer and len(collection.codes) == 79
+    assert store.search("docs", vectors[60], top_k=1)[0]["id"] == "60"
@@ -0,0 +1,722 @@
+import contextlib
+import json
+import os
+import threading
+import uuid
+import numpy as np
+from answer_cache import answer_cache
+from bm25_index import BM25Index
+from collection_names import validate_collection_name
+from quantization import make_quantizer
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory file locks (Windows): writes are only safe from a single process
+    fcntl = None
+
+VECTOR_STORE_DIR = os.path.join(".rag", "vectors")
+
+class VectorStore:
+    """
+    Interface shared by the retrieval backends. Search results are dicts with
+    the point id, its score, its text and the rest of its payload.
+
+    Writes go through upsert/delete/set_payload, which keep the collection's
+    BM25 index and the answer cache in step with the vectors; backends
+    implement the _write/_remove/_update_payloads hooks.
+    """
+
+    def collection_exists(self, collection_name):
+        raise NotImplementedError
+
+    def create_collection(self, collection_name, dim=1024):
+        raise NotImplementedError
+
+    def upsert(self, collection_name, ids, vectors, payloads):
+        """Inserts or replaces points; every payload needs a "text" field for BM25."""
+        ids, payloads = list(ids), list(payloads)
+        if not ids:
+            return
+        self._write(collection_name, ids, vectors, payloads)
+        BM25Index(collection_name).add(ids, payloads)
+        answer_cache.invalidate(collection_name)
+
+    def delete(self, collection_name, ids):
+        ids = list(ids)
+        if not ids:
+            return
+        self._remove(collection_name, ids)
+        BM25Index(collection_name).delete(ids)
+        answer_cache.invalidate(collection_name)
+
+    def set_payload(self, collection_name, ids, payloads):
+        """Updates the payloads of existing points without touching their vectors."""
+        ids, payloads = list(ids), list(payloads)
+        if not ids:
+            return
+        self._update_payloads(collection_name, ids, payloads)
+        BM25Index(collection_name).add(ids, payloads)
+        answer_cache.invalidate(collection_name)
+
+    def document_payloads(self, collection_name, document_id):
+        """Yields (point id, payload) for every point of one document."""
+        raise NotImplementedError
+
+    def _write(self, collection_name, ids, vectors, payloads):
+        raise NotImplementedError
+
+    def _remove(self, collection_name, ids):
+        raise NotImplementedError
+
+    def _update_payloads(self, collection_name, ids, payloads):
+        raise NotImplementedError
+
+    def search(self, collection_name, query_vector, top_k=5, exact=False):
+        raise NotImplementedError
+
+    def search_batch(self, collection_name, query_vectors, top_k=5):
+        return [self.search(collection_name, query_vector, top_k) for query_vector in query_vectors]
+
+def top_k_indices(scores, top_k):
+    # argpartition is O(n); only the k winners get sorted
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, top_k - 1)[:top_k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+class SegmentedMatrix:
+    """
+    Read-only view of memory-mapped segments stacked row-wise, without copying
+    them into one array: rows are addressed globally, work is done per segment.
+    """
+
+    def __init__(self, segments, dim, dtype):
+        self.segments = list(segments)
+        self.offsets = np.cumsum([0] + [len(segment) for segment in self.segments])
+        self.shape = (int(self.offsets[-1]), dim)
+        self.dtype = np.dtype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def blocks(self, block_rows=65536):
+        """Yields (first row, block) pairs; blocks are views into one segment each."""
+        for offset, segment in zip(self.offsets, self.segments):
+            for start in range(0, len(segment), block_rows):
+                yield int(offset) + start, segment[start:start + block_rows]
+
+    def take(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        out = np.empty((len(rows), self.shape[1]), dtype=self.dtype)
+        which = np.searchsorted(self.offsets, rows, side="right") - 1
+        for segment in np.unique(which):
+            mask = which == segment
+            out[mask] = self.segments[segment][rows[mask] - self.offsets[segment]]
+        return out
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            return self.take(np.arange(start, stop, step))
+        return self.take(key)
+
+def dot_scores(vectors, query_vector, block_rows=65536):
+    if isinstance(vectors, SegmentedMatrix):
+        if not vectors.segments:
+            return np.empty(0, dtype=np.float32)
+        return np.concatenate([dot_scores(segment, query_vector, block_rows) for segment in vectors.segments])
+    # float16 rows are scored block by block in float32 to avoid precision loss and a full copy
+    if vectors.dtype == np.float32:
+        return vectors @ query_vector
+    scores = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), block_rows):
+        scores[start:start + block_rows] = vectors[start:start + block_rows].astype(np.float32) @ query_vector
+    return scores
+
+class _GrowableArray:
+    """Array that rows are appended to in amortized O(rows appended), like a list."""
+
+    def __init__(self, dtype, width=None):
+        self._data = np.empty((64,) if width is None else (64, width), dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._data.dtype)
+        if self.size + len(values) > len(self._data):
+            grown = np.empty((max(2 * len(self._data), self.size + len(values)),) + self._data.shape[1:],
+                             dtype=self._data.dtype)
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:self.size + len(values)] = values
+        self.size += len(values)
+
+    def view(self):
+        return self._data[:self.size]
+
+    def __setitem__(self, row, value):
+        self._data[row] = value
+
+class IVFIndex:
+    """
+    Inverted-file index: rows are clustered with k-means and a search only
+    scores the rows in the `n_probe` clusters closest to the query. Rows added
+    later are assigned to the nearest existing centroid; the index is `stale`
+    once the collection has doubled since training and should be retrained.
+    """
+
+    def __init__(self, vectors, n_lists=None, n_iter=10, seed=0):
+        n_rows = len(vectors)
+        self.n_lists = n_lists or max(1, int(np.sqrt(n_rows)))
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(n_rows, size=min(n_rows, 256 * self.n_lists), replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=self.n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            # Per-cluster sums in one pass over the sample sorted by cluster
+            order = np.argsort(assignment, kind="stable")
+            counts = np.bincount(assignment, minlength=self.n_lists)
+            filled = np.flatnonzero(counts)
+            sums = np.add.reduceat(sample[order], np.cumsum(counts)[filled] - counts[filled])
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids[filled] = sums / np.where(norms > 0, norms, 1.0)
+        self.centroids = centroids
+        blocks = vectors.blocks() if isinstance(vectors, SegmentedMatrix) else (
+            (start, vectors[start:start + 65536]) for start in range(0, n_rows, 65536))
+        self.trained_rows = n_rows
+        self._assignment = _GrowableArray(np.int32)
+        for _, block in blocks:
+            self._assignment.extend(self._assign(block))
+        self._relist()
+
+    def _assign(self, block):
+        return np.argmax(np.asarray(block, dtype=np.float32) @ self.centroids.T, axis=1)
+
+    def _relist(self):
+        assignment = self._assignment.view()
+        order = np.argsort(assignment, kind="stable")
+        # Replaced in one assignment, so a concurrent search sees either the old lists or the new ones
+        self._lists = (order, np.searchsorted(assignment[order], np.arange(self.n_lists + 1)), len(assignment))
+
+    def add(self, vectors):
+        """Assigns rows appended after the current last row to their nearest centroids."""
+        for start in range(0, len(vectors), 65536):
+            self._assignment.extend(self._assign(vectors[start:start + 65536]))
+        _, _, listed = self._lists
+        # Unlisted rows are scanned on every search; fold them into the lists once there are many
+        if self._assignment.size - listed > max(listed // 4, 4096):
+            self._relist()
+
+    @property
+    def stale(self):
+        return self._assignment.size > 2 * self.trained_rows
+
+    def remapped(self, rows):
+        """The same clusters over a compacted collection that kept only `rows`, in order."""
+        index = object.__new__(IVFIndex)
+        index.n_lists, index.centroids, index.trained_rows = self.n_lists, self.centroids, self.trained_rows
+        index._assignment = _GrowableArray(np.int32)
+        index._assignment.extend(self._assignment.view()[rows])
+        index._relist()
+        return index
+
+    def candidates(self, query_vector, n_probe):
+        probe = top_k_indices(self.centroids @ query_vector, n_probe)
+        order, offsets, listed = self._lists
+        rows = [order[offsets[c]:offsets[c + 1]] for c in probe]
+        unlisted = self._assignment.view()[listed:]
+        if len(unlisted):
+            rows.append(listed + np.flatnonzero(np.isin(unlisted, probe)))
+        return np.concatenate(rows)
+
+class _LocalCollection:
+    """
+    Append-only on disk: each upsert writes its vectors as a new .npy segment
+    and appends one line to points.jsonl, so a write costs the size of the
+    batch, not of the collection. Deletes and payload updates are log lines
+    too; replaced or deleted rows stay as dead rows until compact() rewrites
+    the collection as a single segment.
+    """
+
+    MAX_SEGMENTS = 256
+
+    def __init__(self, path, dim, dtype):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        # Bumped whenever rows are renumbered, so an index trained on the old rows is discarded
+        self.generation = 0
+        self.training = False
+        self._reset()
+
+    def _reset(self):
+        self.segments = []
+        self.segment_names = []
+        self.ids = []
+        self.payloads = []
+        self.id_to_row = {}
+        self.dead = 0
+        self._vectors = None
+        self._alive = _GrowableArray(bool)
+        self.index = None
+        self.quantizer = None
+        self._codes = None
+        self.fitted_rows = 0
+        self.generation += 1
+        # Bytes of points.jsonl applied so far, and which file they came from (compaction replaces it)
+        self.log_offset = 0
+        self.log_id = None
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        collection = cls(path, meta["dim"], meta["dtype"])
+        if os.path.exists(os.path.join(path, "vectors.npy")):
+            with collection._write_lock():
+                if os.path.exists(os.path.join(path, "vectors.npy")):
+                    collection._convert_single_file()
+        collection.refresh()
+        return collection
+
+    @contextlib.contextmanager
+    def _write_lock(self):
+        # Serializes log appends and compaction across processes sharing the directory
+        with open(os.path.join(self.path, "write.lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def refresh(self):
+        """
+        Applies log lines written by other processes since the last call. If
+        another process compacted the collection (a new log file) the whole
+        collection is reloaded.
+        """
+        log_path = os.path.join(self.path, "points.jsonl")
+        for attempt in range(3):
+            try:
+                f = open(log_path, "rb")
+            except FileNotFoundError:
+                return
+            try:
+                with f:
+                    stat = os.fstat(f.fileno())
+                    log_id = (stat.st_dev, stat.st_ino)
+                    if log_id == self.log_id and stat.st_size == self.log_offset:
+                        return
+                    if self.log_offset and (log_id != self.log_id or stat.st_size < self.log_offset):
+                        self._reset()
+                    self.log_id = log_id
+                    f.seek(self.log_offset)
+                    for line in f:
+                        # A line without its newline is still being written, or its writer crashed;
+                        # either way it hasn't taken effect yet. Only writers truncate it (see _commit)
+                        if not line.endswith(b"\n"):
+                            break
+                        self._apply(json.loads(line))
+                        self.log_offset += len(line)
+                return
+            except FileNotFoundError:
+                # A compaction elsewhere removed segments while the old log was being read; start over
+                if attempt == 2:
+                    raise
+                self._reset()
+
+    def _convert_single_file(self):
+        # Collections saved before segments: one vectors.npy and one {"id", "payload"} line per row
+        with open(os.path.join(self.path, "points.jsonl"), encoding="utf-8") as f:
+            points = [json.loads(line) for line in f]
+        os.makedirs(os.path.join(self.path, "segments"), exist_ok=True)
+        name = self._write_segment(np.load(os.path.join(self.path, "vectors.npy")))
+        entry = {"op": "segment", "file": name, "ids": [point["id"] for point in points],
+                 "payloads": [point["payload"] for point in points]}
+        log_path = os.path.join(self.path, "points.jsonl")
+        with open(f"{log_path}.tmp", "w", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        os.replace(f"{log_path}.tmp", log_path)
+        os.remove(os.path.join(self.path, "vectors.npy"))
+
+    def _apply(self, entry):
+        if entry["op"] == "segment":
+            # Memory-mapped read-only; segments are never modified after they are written
+            segment = np.load(os.path.join(self.path, "segments", entry["file"]), mmap_mode="r")
+            self.segments.append(segment)
+            self.segment_names.append(entry["file"])
+            for point_id, payload in zip(entry["ids"], entry["payloads"]):
+                self._kill(point_id)
+                self.id_to_row[point_id] = len(self.ids)
+                self.ids.append(point_id)
+                self.payloads.append(payload)
+            self._alive.extend(np.ones(len(entry["ids"]), dtype=bool))
+            if self.index is not None:
+                self.index.add(segment)
+            if self._codes is not None:
+                # Encoded with the quantizer as fitted; refitting waits until codes_stale
+                self._codes.extend(self.quantizer.encode(segment))
+            self._vectors = None
+        elif entry["op"] == "delete":
+            for point_id in entry["ids"]:
+                self._kill(point_id)
+        elif entry["op"] == "payload":
+            for point_id, payload in zip(entry["ids"], entry["payloads"]):
+                row = self.id_to_row.get(point_id)
+                if row is not None:
+                    self.payloads[row] = {**self.payloads[row], **payload}
+
+    def _kill(self, point_id):
+        row = self.id_to_row.pop(point_id, None)
+        if row is not None:
+            self.ids[row] = None
+            self.payloads[row] = None
+            self._alive[row] = False
+            self.dead += 1
+
+    def _commit(self, entry):
+        # Only called under _write_lock, right after refresh()
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        with open(os.path.join(self.path, "points.jsonl"), "ab") as f:
+            # Anything past the applied lines is a write that crashed mid-line; drop it so this line stays readable
+            f.truncate(self.log_offset)
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+            stat = os.fstat(f.fileno())
+        self._apply(entry)
+        self.log_offset, self.log_id = self.log_offset + len(line), (stat.st_dev, stat.st_ino)
+
+    def save_meta(self):
+        os.makedirs(os.path.join(self.path, "segments"), exist_ok=True)
+        with open(os.path.join(self.path, "meta.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.name}, f)
+        os.replace(os.path.join(self.path, "meta.json.tmp"), os.path.join(self.path, "meta.json"))
+
+    def _write_segment(self, vectors):
+        name = f"{uuid.uuid4().hex}.npy"
+        np.save(os.path.join(self.path, "segments", name), vectors)
+        return name
+
+    @property
+    def size(self):
+        return len(self.id_to_row)
+
+    @property
+    def vectors(self):
+        """All rows, dead ones included, as a view over the memory-mapped segments."""
+        if self._vectors is None:
+            self._vectors = SegmentedMatrix(self.segments, self.dim, self.dtype)
+        return self._vectors
+
+    @property
+    def alive(self):
+        return self._alive.view()
+
+    @property
+    def codes(self):
+        return None if self._codes is None else self._codes.view()
+
+    def set_codes(self, quantizer, codes):
+        self.quantizer = quantizer
+        self._codes = _GrowableArray(codes.dtype, codes.shape[1])
+        self._codes.extend(codes)
+        self.fitted_rows = len(codes)
+
+    @property
+    def codes_stale(self):
+        # The quantizer's ranges come from the rows it was fitted on; refit once they're under half the rows
+        return self._codes is None or len(self.ids) > 2 * self.fitted_rows
+
+    def upsert(self, ids, vectors, payloads):
+        vectors = np.asarray(vectors, dtype=self.dtype).reshape(-1, self.dim)
+        # The segment is on disk before the log line that makes it visible
+        entry = {"op": "segment", "file": self._write_segment(vectors), "ids": ids, "payloads": payloads}
+        with self._write_lock():
+            self.refresh()
+            self._commit(entry)
+            self._maybe_compact()
+
+    def delete(self, ids):
+        with self._write_lock():
+            self.refresh()
+            ids = [point_id for point_id in ids if point_id in self.id_to_row]
+            if not ids:
+                return
+            self._commit({"op": "delete", "ids": ids})
+            self._maybe_compact()
+
+    def set_payload(self, ids, payloads):
+        with self._write_lock():
+            self.refresh()
+            self._commit({"op": "payload", "ids": ids, "payloads": payloads})
+
+    def _maybe_compact(self):
+        # Dead rows above half the matrix, or too many files; both keep compaction amortized
+        if self.dead > max(self.size, 1024) or len(self.segments) > self.MAX_SEGMENTS:
+            self._compact()
+
+    def compact(self):
+        with self._write_lock():
+            self.refresh()
+            self._compact()
+
+    def _compact(self):
+        alive = self.alive
+        live = np.flatnonzero(alive)
+        ids = [self.ids[row] for row in live]
+        payloads = [self.payloads[row] for row in live]
+        # Streamed segment by segment into the new file, so compaction never holds the collection in RAM
+        name = f"{uuid.uuid4().hex}.npy"
+        out = np.lib.format.open_memmap(os.path.join(self.path, "segments", name), mode="w+",
+                                        dtype=self.dtype, shape=(len(live), self.dim))
+        written = 0
+        for start, block in self.vectors.blocks():
+            keep = block[alive[start:start + len(block)]]
+            out[written:written + len(keep)] = keep
+            written += len(keep)
+        out.flush()
+        del out
+        log_path = os.path.join(self.path, "points.jsonl")
+        line = (json.dumps({"op": "segment", "file": name, "ids": ids, "payloads": payloads}) + "\n").encode("utf-8")
+        with open(f"{log_path}.tmp", "wb") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+            stat = os.fstat(f.fileno())
+        os.replace(f"{log_path}.tmp", log_path)
+        old_names = self.segment_names
+        # Rows are renumbered; the index keeps its clusters and just follows the surviving rows
+        index = self.index.remapped(live) if self.index is not None else None
+        quantizer, codes, fitted_rows = self.quantizer, self.codes, self.fitted_rows
+        self._reset()
+        self._apply(json.loads(line))
+        self.index = index
+        if codes is not None:
+            self.set_codes(quantizer, codes[live])
+            self.fitted_rows = fitted_rows
+        self.log_offset, self.log_id = len(line), (stat.st_dev, stat.st_ino)
+        # Other processes still holding these memory-mapped keep reading them until they refresh;
+        # a process that starts reading the old log after this finds them gone and reloads
+        for old_name in old_names:
+            try:
+                os.remove(os.path.join(self.path, "segments", old_name))
+            except OSError:
+                pass
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process backend: each collection is a float32 (or float16) matrix saved
+    as append-only .npy segments and memory-mapped on load, searched with a vectorized dot product
+    and argpartition. Large collections can build an IVF index with
+    build_index() to search only a few clusters instead of every row. Later
+    writes join the existing clusters; k-means only reruns, outside the store
+    lock, once the collection has doubled since the last training.
+
+    Several processes (e.g. gunicorn workers) can share one root: writes and
+    compactions take a file lock on the collection, and every access first
+    applies what other processes appended to points.jsonl since, reloading
+    the collection when a compaction replaced the log.
+
+    With quantization="int8" or "binary" searches run over compact codes kept
+    in RAM and the best `oversample * top_k` candidates are rescored against
+    the float vectors, reading only those rows from the memory-mapped
+    segments. New segments are encoded as they are written; the quantizer is
+    refitted, like the index, only once the collection has doubled.
+    """
+
+    def __init__(self, root=VECTOR_STORE_DIR, dtype=np.float32, ivf_min_rows=50_000, n_probe=8,
+                 quantization=None, oversample=None):
+        self.root = root
+        self.dtype = dtype
+        self.quantization = quantization
+        # Sign bits lose more ranking information than int8, so binary needs a wider shortlist
+        self.oversample = oversample or {"int8": 4, "binary": 16}.get(quantization, 4)
+        self.ivf_min_rows = ivf_min_rows
+        self.n_probe = n_probe
+        self._collections = {}
+        self._lock = threading.RLock()
+
+    def _path(self, collection_name):
+        return os.path.join(self.root, validate_collection_name(collection_name))
+
+    def _get(self, collection_name):
+        with self._lock:
+            if collection_name not in self._collections:
+                path = self._path(collection_name)
+                if not os.path.exists(os.path.join(path, "meta.json")):
+                    raise KeyError(f"Collection {collection_name} does not exist.")
+                self._collections[collection_name] = _LocalCollection.load(path)
+            else:
+                # Picks up writes from other workers; a stat when nothing changed
+                self._collections[collection_name].refresh()
+            return self._collections[collection_name]
+
+    def collection_exists(self, collection_name):
+        return collection_name in self._collections or os.path.exists(os.path.join(self._path(collection_name), "meta.json"))
+
+    def create_collection(self, collection_name, dim=1024):
+        with self._lock:
+            if self.collection_exists(collection_name):
+                return
+            collection = _LocalCollection(self._path(collection_name), dim, self.dtype)
+            collection.save_meta()
+            self._collections[collection_name] = collection
+
+    def _write(self, collection_name, ids, vectors, payloads):
+        with self._lock:
+            self._get(collection_name).upsert(ids, vectors, payloads)
+
+    def _remove(self, collection_name, ids):
+        with self._lock:
+            self._get(collection_name).delete(ids)
+
+    def _update_payloads(self, collection_name, ids, payloads):
+        with self._lock:
+            self._get(collection_name).set_payload(ids, payloads)
+
+    def document_payloads(self, collection_name, document_id):
+        if not self.collection_exists(collection_name):
+            return
+        with self._lock:
+            collection = self._get(collection_name)
+            points = [
+                (point_id, payload) for point_id, payload in zip(collection.ids, collection.payloads)
+                if point_id is not None and payload.get("document_id") == document_id
+            ]
+        yield from points
+
+    def compact(self, collection_name):
+        """Rewrites a collection as one segment without its dead rows."""
+        with self._lock:
+            self._get(collection_name).compact()
+
+    def build_index(self, collection_name, n_lists=None):
+        with self._lock:
+            collection = self._get(collection_name)
+            collection.training = True
+        self._train(collection, index=True, n_lists=n_lists)
+
+    def _train(self, collection, index=False, codes=False, n_lists=None):
+        # k-means and quantizer fitting run outside the store lock on the segments as they are now
+        # (they never change); rows written meanwhile are added before the results are installed
+        try:
+            with self._lock:
+                generation, segments = collection.generation, list(collection.segments)
+            vectors = SegmentedMatrix(segments, collection.dim, collection.dtype)
+            new_index = IVFIndex(vectors, n_lists=n_lists) if index else None
+            if codes:
+                quantizer = make_quantizer(self.quantization).fit(vectors)
+                new_codes = quantizer.encode(vectors)
+            with self._lock:
+                if collection.generation == generation:
+                    added = collection.segments[len(segments):]
+                    if index:
+                        for segment in added:
+                            new_index.add(segment)
+                        collection.index = new_index
+                    if codes:
+                        collection.set_codes(quantizer, np.concatenate([new_codes] + [quantizer.encode(segment) for segment in added]))
+        finally:
+            with self._lock:
+                collection.training = False
+
+    def _snapshot(self, collection_name, exact=True):
+        with self._lock:
+            collection = self._get(collection_name)
+            index = (not exact and collection.size >= self.ivf_min_rows
+                     and (collection.index is None or collection.index.stale))
+            codes = not exact and self.quantization is not None and collection.size > 0 and collection.codes_stale
+            train = (index or codes) and not collection.training
+            if train:
+                collection.training = True
+        if train:
+            # Only this query waits for (re)training; concurrent ones keep using what is there, or exact search
+            self._train(collection, index=index, codes=codes)
+        # Vectors, alive mask, index and codes are taken together, so a concurrent write can't misalign them
+        with self._lock:
+            collection = self._get(collection_name)
+            return collection, collection.vectors, collection.alive, collection.index, (collection.quantizer, collection.codes)
+
+    def _results(self, collection, rows, scores):
+        with self._lock:
+            # Rows deleted since the snapshot are skipped
+            return [
+                {"id": collection.ids[row], **collection.payloads[row], "score": float(score)}
+                for row, score in zip(rows, scores)
+                if collection.ids[row] is not None
+            ]
+
+    def search_batch(self, collection_name, query_vectors, top_k=5):
+        collection, vectors, alive, index, _ = self._snapshot(collection_name)
+        if index is not None or self.quantization or collection.size >= self.ivf_min_rows:
+            return super().search_batch(collection_name, query_vectors, top_k)
+
+        # Exact path: score every query in one matrix product, block by block over the rows
+        query_vectors = np.asarray(query_vectors, dtype=np.float32).reshape(-1, collection.dim)
+        scores = np.empty((len(query_vectors), len(vectors)), dtype=np.float32)
+        for start, block in vectors.blocks():
+            scores[:, start:start + len(block)] = query_vectors @ np.asarray(block, dtype=np.float32).T
+        scores[:, ~alive] = -np.inf
+        top_k = min(top_k, int(alive.sum()))
+        results = []
+        for query_scores in scores:
+            best = top_k_indices(query_scores, top_k)
+            results.append(self._results(collection, best, query_scores[best]))
+        return results
+
+    def search(self, collection_name, query_vector, top_k=5, exact=False):
+        collection, vectors, alive, index, (quantizer, codes) = self._snapshot(collection_name, exact)
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        n_live = int(alive.sum())
+
+        rows = None if exact or index is None else index.candidates(query_vector, self.n_probe)
+        if rows is not None:
+            # The index may already hold rows written after the snapshot
+            rows = rows[rows < len(alive)]
+            rows = rows[alive[rows]]
+        if not exact and codes is not None and n_live:
+            # Shortlist on the codes, then rescore only the shortlist with the float vectors
+            codes = codes if rows is None else codes[rows]
+            code_scores = quantizer.scores(codes, query_vector)
+            if rows is None:
+                code_scores[~alive] = -np.inf
+            shortlist = top_k_indices(code_scores, min(top_k * self.oversample, n_live))
+            rows = shortlist if rows is None else rows[shortlist]
+
+        if rows is not None:
+            # Sorted rows read the memory-mapped matrix front to back
+            rows = np.sort(rows)
+            scores = dot_scores(vectors[rows], query_vector)
+            best = top_k_indices(scores, top_k)
+            best_rows, best_scores = rows[best], scores[best]
+        else:
+            scores = dot_scores(vectors, query_vector)
+            scores[~alive] = -np.inf
+            best_rows = top_k_indices(scores, min(top_k, n_live))
+            best_scores = scores[best_rows]
+
+        return self._results(collection, best_rows, best_scores)
+
+_vector_stores = {}
+_vector_stores_lock = threading.Lock()
+
+def get_vector_store(backend=None, quantization=None):
+    """
+    Returns the backend named by `backend` or the VECTOR_STORE env var ("qdrant"
+    or "local"). Quantization ("int8", "binary") defaults to VECTOR_QUANTIZATION.
+    """
+    backend = backend or os.environ.get("VECTOR_STORE", "qdrant")
+    quantization = quantization or os.environ.get("VECTOR_QUANTIZATION") or None
+    # One instance per process, so ingest writes and query reads see the same collections
+    with _vector_stores_lock:
+        if (backend, quantization) not in _vector_stores:
+            if backend == "local":
+                store = LocalVectorStore(quantization=quantization)
+            elif backend == "qdrant":
+                from qdrant import QdrantVectorStore
+                store = QdrantVectorStore(quantization=quantization)
+            else:
+                raise ValueError(f"Unknown vector store backend: {backend}")
+            _vector_stores[(backend, quantization)] = store
+        return _vector_stores[(backend, quantization)]